@@ -1,16 +1,41 @@
-"""Lambda handler for processing input, output and exceptions."""
+"""
+Lambda handler for processing input, output and exceptions.
 
-# pylint: disable=invalid-name, logging-fstring-interpolation, broad-except
+Banana, and with it boto3, requests et al, is only imported on first use to keep the import of this
+module cheap. Set PREWARM_CLIENTS=true to instead do that import, create the DynamoDB resource and
+fetch the Oxford credentials while the module loads, during the Lambda init phase and outside of
+any invocation. Use `python -m cli_tools.import_profiler` to measure what importing costs.
+
+Sentences can be paged through by passing the query string parameters `page_size` and `cursor`. The
+response is then an object holding the page of `sentences`, an estimate of the `total` and the
+`next_cursor`, which is null on the last page. Without them every sentence is returned in a list.
+A cursor points at where the page left off, so a deep page costs no more than the first one.
+
+If the body is an object of phrases keyed by friend's name rather than a list of phrases, it is run
+as a batch and the response is an object of sentences keyed by the same names. Batches aren't paged.
+
+Each invocation's spans and counts are published from `bananas_as_a_service.instrumentation` when it
+finishes, as CloudWatch Embedded Metric Format if METRICS_NAMESPACE is set.
+"""
+
+# pylint: disable=invalid-name, logging-fstring-interpolation, broad-except, global-statement
+# pylint: disable=import-outside-toplevel
 
 import json
+import os
 
+from bananas_as_a_service import instrumentation
 from bananas_as_a_service.app_logger import Logger
-from bananas_as_a_service.banana import Banana
+from bananas_as_a_service.error_handler import CursorError
 
 logger = Logger.get_logger()
 
 HTTP_OK = 200
+HTTP_BAD_REQUEST = 400
 HTTP_INTERNAL_SERVER_ERROR = 500
+MAX_PAGE_SIZE = 10000
+
+_banana_class = None
 
 
 def lambda_handler(event, context):
@@ -24,17 +49,79 @@ def lambda_handler(event, context):
     """
     logger.info(f"Beginning Lambda execution with context: {context}")
 
+    # The container may be re-used, so only count what happens during this invocation.
+    instrumentation.reset()
+    try:
+        with instrumentation.span('lambda_handler'):
+            response = _handle(event)
+        instrumentation.increment(f"http.{response.get('statusCode')}")
+    finally:
+        function_name = getattr(context, 'function_name', None)
+        instrumentation.publish({'FunctionName': function_name} if function_name else None)
+    return response
+
+
+def _handle(event):
     body = json.loads(event.get('body'))
     logger.info(f"Lambda body: {body}")
     try:
-        sentences = Banana().execute(body)
+        page_size, cursor = _parse_pagination(event)
+        if isinstance(body, dict) and page_size is not None:
+            raise ValueError("batches can't be paged")
+    except ValueError as exc:
+        logger.error(f"Invalid pagination parameters: {exc}")
+        return _create_body(HTTP_BAD_REQUEST, f"Invalid pagination parameters: {exc}")
+
+    if isinstance(body, dict):
+        # A bare string would otherwise be tokenised a character at a time.
+        invalid = [name for name, phrases in body.items() if not _is_phrases(phrases)]
+        if invalid:
+            logger.error(f"Invalid batch for: {invalid}")
+            return _create_body(
+                HTTP_BAD_REQUEST, f"Invalid batch: phrases for {invalid} must be a list of strings")
+
+    try:
+        banana = _get_banana_class()()
+        if isinstance(body, dict):
+            sentences = banana.execute_batch(body)
+        elif page_size is None:
+            sentences = banana.execute(body)
+        else:
+            sentences = banana.execute(body, limit=page_size, cursor=cursor)
+    except CursorError as exc:
+        logger.error(f"Invalid pagination parameters: {exc}")
+        return _create_body(HTTP_BAD_REQUEST, f"Invalid pagination parameters: {exc}")
     except Exception as exc:
         # FIXME: handle exceptions more gracefully and return various HTTP error codes
         exc_message = "Exception in execution:"
         logger.exception(f"{exc_message} {exc}")
         return _create_body(HTTP_INTERNAL_SERVER_ERROR, f"{exc_message} {exc}")
-    else:
+
+    if page_size is None:
         return _create_body(HTTP_OK, sentences)
+    return _create_body(HTTP_OK, {
+        'sentences': sentences,
+        'total': banana.estimated_count,
+        'next_cursor': banana.next_cursor,
+    })
+
+
+def _is_phrases(phrases):
+    return isinstance(phrases, list) and all(isinstance(phrase, str) for phrase in phrases)
+
+
+def _parse_pagination(event):
+    # The cursor is opaque here, Banana checks it against the phrases.
+    params = event.get('queryStringParameters') or {}
+    if params.get('page_size') is None:
+        if params.get('cursor') is not None:
+            raise ValueError("cursor given without page_size")
+        return None, None
+
+    page_size = int(params.get('page_size'))
+    if not 0 < page_size <= MAX_PAGE_SIZE:
+        raise ValueError(f"page_size must be between 1 and {MAX_PAGE_SIZE}")
+    return page_size, params.get('cursor') or None
 
 
 def _create_body(status, body):
@@ -42,3 +129,33 @@ def _create_body(status, body):
         'statusCode': status,
         'body': json.dumps(body),
     }
+
+
+def _get_banana_class():
+    global _banana_class
+
+    if _banana_class is None:
+        from bananas_as_a_service.banana import Banana
+        _banana_class = Banana
+    return _banana_class
+
+
+def prewarm():
+    """Imports the application and creates the clients shared by warm invocations."""
+    logger.info("Pre-warming imports and clients")
+
+    _get_banana_class()
+
+    from bananas_as_a_service.aws import connect_to_aws_resource, get_from_parameter_store
+    from bananas_as_a_service.number_words import precompute
+    precompute()
+    connect_to_aws_resource('dynamodb')
+    get_from_parameter_store(['app_id', 'app_key'])
+
+
+if os.environ.get('PREWARM_CLIENTS', '').lower() == 'true':
+    try:
+        prewarm()
+    except Exception as exc:
+        # Not fatal, the handler will create whatever is missing when it first needs it.
+        logger.exception(f"Exception pre-warming: {exc}")
@@ -1,28 +1,50 @@
-"""Utilities for interacting with AWS via boto3"""
+"""
+Utilities for interacting with AWS via boto3. Clients, resources and parameters are held at module
+level so that warm Lambda invocations re-use them rather than paying to create them again.
+"""
 
 # pylint: disable=invalid-name, logging-fstring-interpolation
 
 import os
+import time
+
+from threading import Lock
 
 import boto3
 
 from botocore.exceptions import ProfileNotFound, SSLError, ClientError, ConnectTimeoutError
 
 from bananas_as_a_service.app_logger import Logger
+from bananas_as_a_service.environment import get_int
 from bananas_as_a_service.error_handler import GeneralError
 
 logger = Logger().get_logger()
 
+DEFAULT_PARAMETER_TTL = 900  # Seconds
+_GET_PARAMETERS_LIMIT = 10  # Maximum names per GetParameters request imposed by SSM
+
+_lock = Lock()
+_resources = {}
+_clients = {}
+_parameters = {}
+
 
 def connect_to_aws_resource(resource_name):
     """
-    Pass in the AWS service and return a boto3 resource.
+    Pass in the AWS service and return a boto3 resource, re-using one already created.
 
     :param resource_name: Name of AWS service
     :type resource_name: :class: `str`
     :return: boto3 resource
     :rtype: :class: `boto3.resource`
     """
+    with _lock:
+        if resource_name not in _resources:
+            _resources[resource_name] = _create_resource(resource_name)
+        return _resources[resource_name]
+
+
+def _create_resource(resource_name):
     logger.info(f"Attempting connection to AWS resource: {resource_name}")
 
     try:
@@ -40,13 +62,20 @@ def connect_to_aws_resource(resource_name):
 
 def connect_to_aws_client(client_name):
     """
-    Pass in the AWS service and return a boto3 client.
+    Pass in the AWS service and return a boto3 client, re-using one already created.
 
     :param client_name: Name of AWS service
     :type client_name: :class: `str`
     :return: boto3 resource
     :rtype: :class: `boto3.client`
     """
+    with _lock:
+        if client_name not in _clients:
+            _clients[client_name] = _create_client(client_name)
+        return _clients[client_name]
+
+
+def _create_client(client_name):
     logger.info(f"Attempting connection to AWS client: {client_name}")
 
     try:
@@ -66,22 +95,50 @@ def get_from_parameter_store(parameters):
     """
     Pass in a list of parameters to access in Systems Manager Parameter Store.
 
+    Values are cached for PARAMETER_CACHE_TTL seconds; any that are missing or stale are fetched
+    together with GetParameters rather than one request per parameter.
+
     :param parameters: Key names to look up
     :type parameters: :class: `list`
     :return: Values of keys
     :rtype: :class: `dict`
     """
-    logger.info(f"Attempting lookup of parameters: {parameters}")
-
+    now = time.monotonic()
     ssm_parameters = {}
-    try:
+    stale = []
+    with _lock:
         for param in parameters:
-            this_param = connect_to_aws_client('ssm').get_parameter(Name=param, WithDecryption=True)
-            ssm_parameters.update({
-                this_param.get('Parameter').get('Name'): this_param.get('Parameter').get('Value')})
+            cached = _parameters.get(param)
+            if cached and cached[0] > now:
+                ssm_parameters[param] = cached[1]
+            else:
+                stale.append(param)
+
+    if not stale:
+        return ssm_parameters
+
+    logger.info(f"Attempting lookup of parameters: {stale}")
+
+    fetched = {}
+    try:
+        ssm_client = connect_to_aws_client('ssm')
+        for start in range(0, len(stale), _GET_PARAMETERS_LIMIT):
+            response = ssm_client.get_parameters(
+                Names=stale[start:start + _GET_PARAMETERS_LIMIT], WithDecryption=True)
+            if response.get('InvalidParameters'):
+                raise GeneralError(
+                    f"Parameters not found in Parameter Store: {response.get('InvalidParameters')}")
+            fetched.update({
+                param.get('Name'): param.get('Value') for param in response.get('Parameters')})
     except ProfileNotFound as err:
         raise GeneralError(f"Could not find AWS profile: {err}")
     except ClientError as err:
         raise GeneralError(f"Error getting parameters from Parameter Store: {err}")
-    else:
-        return ssm_parameters
+
+    expires = now + get_int('PARAMETER_CACHE_TTL', DEFAULT_PARAMETER_TTL)
+    with _lock:
+        for name, value in fetched.items():
+            _parameters[name] = (expires, value)
+
+    ssm_parameters.update(fetched)
+    return ssm_parameters
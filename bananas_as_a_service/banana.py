@@ -30,6 +30,22 @@ works, I promise. Don't look behind the curtain.
 Finally this is where the AI/Matrix/Machines/Terminators really get their AI on. Using the
 super-advanced word ordering from above a bunch of sentences are constructed. And they are totes
 legit. Finally these are dumped to our friendly neighbourhood `StreamHandler` logger.
+
+The super-advanced word ordering is a `Grammar` of templates, see `bananas_as_a_service.grammar`.
+Set GRAMMAR_TEMPLATES for something even more advanced than adverb, adjective, noun.
+
+The number of sentences is the product of the number of words in each category, which gets big
+fast. So sentences are generated lazily one at a time, and `limit` and `cursor` can be passed to
+only make the page of them that is wanted. Words are sorted within each category so that the same
+phrases always give the same sentences in the same order, and pages don't shift between requests.
+The cursor is the position of the last sentence of a page, e.g. '0.3.1.12', so the next page starts
+straight from there however deep it is. Use `stream` to go through every sentence without paging.
+
+Got a whole team of friends? Pass their phrases keyed by name to `execute_batch` instead. Each word
+is only classified once no matter how many friends say it, then everyone gets their own sentences.
+
+Each stage is timed as a 'banana.<stage>' span, see `bananas_as_a_service.instrumentation`. Ordering
+is lazy so its time is part of the 'banana.generate' span.
 """
 
 # pylint: disable=invalid-name, logging-fstring-interpolation, ungrouped-imports
@@ -37,13 +53,15 @@ legit. Finally these are dumped to our friendly neighbourhood `StreamHandler` lo
 
 import re
 
-from itertools import product
+from itertools import chain, islice
 
-from num2words import num2words
 from ordered_set import OrderedSet
-from word2number import w2n
 
+from bananas_as_a_service import instrumentation
 from bananas_as_a_service.app_logger import Logger
+from bananas_as_a_service.error_handler import CursorError
+from bananas_as_a_service.grammar import Grammar
+from bananas_as_a_service.number_words import to_number, to_words
 from bananas_as_a_service.word_classifier import WordClassifier
 
 
@@ -51,123 +69,239 @@ from bananas_as_a_service.word_classifier import WordClassifier
 class Banana:
     """Turns common phrases into new and fun sentences."""
 
-    _ORDERING = ['number', 'adverb', 'adjective', 'noun']
     _NUMBERS_AS_WORDS = 10
     _FIRST_WORD = 0
+    _NOT_A_WORD = re.compile(r'([^\s\w]|_)+')
 
-    def __init__(self):
+    def __init__(self, grammar=None):
+        """
+        :param grammar: Templates to order words by, defaults to GRAMMAR_TEMPLATES or the basics
+        :type grammar: :class: `Grammar`
+        """
         self._logger = Logger().get_logger()
+        self._grammar = grammar if grammar is not None else Grammar.from_environment()
+        self._index = None
+        self._estimated_count = None
+        self._next_cursor = None
+
+    @property
+    def estimated_count(self):
+        """
+        Returns the upper bound on the number of sentences, worked out from how many words there are
+        in each category without making any of them. Repeated words mean there may be fewer.
+        """
+        return self._estimated_count
+
+    @property
+    def next_cursor(self):
+        """Returns the cursor for the page after the one just made, None after the last page."""
+        return self._next_cursor
 
-    def execute(self, data):
+    def execute(self, data, limit=None, offset=0, cursor=None):
         """
         Entry point to parse your friend's phrases.
 
         Functional/procedural style of programming where we fetch what we want, pass it for
         processing and use the returned value for the next process; not a true "object".
+
+        :param data: Phrases
+        :type data: :class: `list`
+        :param limit: Maximum number of sentences to return, all of them if None
+        :type limit: :class: `int`
+        :param offset: Number of sentences to skip before the first one returned
+        :type offset: :class: `int`
+        :param cursor: Start after the page this came from, see `next_cursor`
+        :type cursor: :class: `str`
+        :return: Sentences
+        :rtype: :class: `list`
         """
         self._logger.info(f"Executing Banana for data: {data}")
 
-        tokens = self._tokenise(data)
-        words_as_numbers = list(set(self._words_to_numbers(tokens)))
-        classified = WordClassifier(words_as_numbers).classify()
-        cleaned = self._clean(classified)
-        ordered = self._order(cleaned)
-        return self._make_some_sentences(ordered)
+        after = self._decode_cursor(cursor)
+        classifier, cleaned = self._classify(data)
+        try:
+            with instrumentation.span('banana.generate'):
+                ordered = self._order(cleaned, after)
+                stop = offset + limit if limit is not None else None
+                # Skip to the page before formatting, so skipped sentences are never made strings.
+                page = list(islice(ordered, offset, stop))
+                more = limit is not None and next(ordered, None) is not None
+                sentences = list(self._make_some_sentences(page))
+            self._next_cursor = self._encode_cursor(page[-1]) if page and more else None
+            instrumentation.increment('banana.sentences', len(sentences))
+        finally:
+            self._flush(classifier)
+        return sentences
+
+    def stream(self, data):
+        """
+        Entry point to parse your friend's phrases one sentence at a time, however many there are.
+
+        The words are classified up front, then each sentence is only made when it is asked for.
+
+        :param data: Phrases
+        :type data: :class: `list`
+        :return: Sentences
+        :rtype: :class: `generator`
+        """
+        self._logger.info(f"Streaming Banana for data: {data}")
+
+        classifier, cleaned = self._classify(data)
+        count = 0
+        try:
+            ordered = self._order(cleaned)
+            for sentence in self._make_some_sentences(ordered):
+                count += 1
+                yield sentence
+        finally:
+            instrumentation.increment('banana.sentences', count)
+            self._flush(classifier)
+
+    def execute_batch(self, batch):
+        """
+        Entry point to parse many friends' phrases at once.
+
+        The words from every friend are de-duplicated and classified together, then the sentences
+        for each friend are made from their own words only.
+
+        :param batch: Phrases keyed by friend's name
+        :type batch: :class: `dict`
+        :return: Sentences keyed by friend's name
+        :rtype: :class: `dict`
+        """
+        self._logger.info(f"Executing Banana batch for: {list(batch)}")
+
+        with instrumentation.span('banana.tokenise'):
+            words_by_name = {name: self.words(phrases) for name, phrases in batch.items()}
+            all_words = list(OrderedSet(chain.from_iterable(words_by_name.values())))
+        instrumentation.increment('banana.words', len(all_words))
+        classifier = WordClassifier(all_words)
+        try:
+            with instrumentation.span('banana.classify'):
+                classified = classifier.classify()
+            with instrumentation.span('banana.clean'):
+                cleaned = self._clean(classified)
+            self._logger.info(
+                f"Classified {len(all_words)} unique word(s) for {len(words_by_name)} friend(s)")
+
+            with instrumentation.span('banana.generate'):
+                by_word = {classification.word: classification for classification in cleaned}
+                sentences = {}
+                for name, words in words_by_name.items():
+                    theirs = [by_word.get(word) for word in words if word in by_word]
+                    sentences[name] = list(self._make_some_sentences(self._order(theirs)))
+            instrumentation.increment(
+                'banana.sentences', sum(len(theirs) for theirs in sentences.values()))
+        finally:
+            self._flush(classifier)
+        return sentences
+
+    @classmethod
+    def words(cls, phrases):
+        """
+        Tokenises phrases into the words Banana classifies, e.g. to classify them ahead of time.
+
+        :param phrases: Phrases
+        :type phrases: :class: `list`
+        :return: Unique words, with numbers as ints, in the order first seen
+        :rtype: :class: `list`
+        """
+        tokens = cls._tokenise(phrases)
+        # 'five' and '5' are different tokens but the same number.
+        return list(OrderedSet(cls._words_to_numbers(tokens)))
+
+    def _classify(self, data):
+        # Returns the classifier, to flush once the sentences are made, and the cleaned words.
+        with instrumentation.span('banana.tokenise'):
+            words_as_numbers = self.words(data)
+        instrumentation.increment('banana.words', len(words_as_numbers))
+        classifier = WordClassifier(words_as_numbers)
+        try:
+            with instrumentation.span('banana.classify'):
+                classified = classifier.classify()
+            with instrumentation.span('banana.clean'):
+                cleaned = self._clean(classified)
+        except Exception:
+            self._flush(classifier)
+            raise
+        return classifier, cleaned
+
+    @classmethod
+    def _flush(cls, classifier):
+        # New words are saved to DynamoDB while the sentences are made; wait for them to land even
+        # if making them failed, as the container can be frozen as soon as the handler returns.
+        with instrumentation.span('banana.flush'):
+            classifier.flush()
 
     @classmethod
     def _tokenise(cls, data):
         # Get rid of anything that isn't a word or space, then make them uniformly lower case.
+        # Splitting on any run of (unicode) whitespace means there are never empty tokens.
         all_your_token_are_belong_to_us = set()
         for phrase in data:
-            youre_not_special = re.sub(r'([^\s\w]|_)+', '', str(phrase))
-            all_your_token_are_belong_to_us.update(set(youre_not_special.lower().split(' ')))
-        return list(all_your_token_are_belong_to_us)
+            youre_not_special = cls._NOT_A_WORD.sub('', str(phrase))
+            for token in youre_not_special.lower().split():
+                if token not in all_your_token_are_belong_to_us:
+                    all_your_token_are_belong_to_us.add(token)
+                    yield token
 
     @classmethod
     def _words_to_numbers(cls, tokens):
-        for index, token in enumerate(tokens):
-            try:
-                as_number = w2n.word_to_num(token)
-            except ValueError:
-                pass  # Ignore other words
-            else:
-                tokens[index] = as_number
-        return tokens
+        for token in tokens:
+            as_number = to_number(token)
+            yield as_number if as_number is not None else token  # Ignore other words
 
     def _clean(self, classified):
         # This is a very simple sentence generator so throw away categories we don't account for.
-        for word in classified:
-            for value in word.values():
-                for category in value.get('categories'):
-                    if category not in self._ORDERING:
-                        value.get('categories').remove(category)
-        return classified
-
-    def _order(self, cleaned):
+        return [
+            classification.restricted_to(self._grammar.categories) for classification in classified
+        ]
+
+    def _order(self, cleaned, after=None):
         # TODO: Word == (adjective or noun) && (plural) && (before a noun) -> make singular e.g.:
         #   - Five easy bananas minutes. (Weird-as-a-Service)
         #   - Five easy banana minutes. (Totally sensible Driven Development)
-        mapped = {}
-        for words in cleaned:
-            for key, value in words.items():
-                for kind in self._ORDERING:
-                    if kind in value.get('categories'):
-                        mapped.setdefault(kind, []).append(key)
-
-        remove_empty = list(
-            filter(None, [
-                mapped.get('number'),
-                mapped.get('adverb'),
-                mapped.get('adjective'),
-                mapped.get('noun'),
-            ])
-        )
-
-        # Order the words in the sentence using a basic English language syntax.
-        cartesian_product = list(product(*remove_empty))
-        sentences = [list(self._flat_tuple(item)) for item in cartesian_product]
-
-        duplicates_removed = OrderedSet([tuple(OrderedSet(sentence)) for sentence in sentences])
-        # Having no numbers at the start of otherwise valid sentences is legit English.
-        no_need_for_numbers = OrderedSet([
-            tuple(self._get_rest(sentence)) for sentence in duplicates_removed
-            if isinstance(self._get_first(sentence), int) and len(sentence) > 1
-        ])
-        return duplicates_removed.union(no_need_for_numbers)
-
-    def _flat_tuple(self, nice_tuple):
-        # Shout out to my man for inspiration on this one: https://adammonsen.com/post/176/
-        if not isinstance(nice_tuple, (tuple, list)):
-            return nice_tuple,
-        if not nice_tuple:
-            return tuple(nice_tuple)
-        return (
-            self._flat_tuple(self._get_first(nice_tuple)) +
-            self._flat_tuple(self._get_rest(nice_tuple))
-        )
+        # Order the words in the sentence using a basic English language syntax. There can be an
+        # enormous number of sentences so they are made one at a time and never all held.
+        self._index = self._grammar.index(cleaned)
+        self._estimated_count = self._grammar.estimate_count(self._index)
+        try:
+            return self._grammar.sentences(self._index, after)
+        except ValueError as err:
+            raise CursorError(f"Cursor doesn't match these phrases: {err}")
+
+    def _encode_cursor(self, sentence):
+        # Only the last sentence of a page needs its position, worked out here from its words.
+        number, choices = self._grammar.position(self._index, sentence)
+        return '.'.join(str(index) for index in (number, *choices))
+
+    @classmethod
+    def _decode_cursor(cls, cursor):
+        if cursor is None:
+            return None
+        try:
+            number, *choices = (int(index) for index in cursor.split('.'))
+        except ValueError:
+            raise CursorError(f"Cursor isn't one from a previous page: {cursor}")
+        return number, tuple(choices)
 
     @classmethod
     def _get_first(cls, collection):
         first, *_ = collection
         return first
 
-    @classmethod
-    def _get_rest(cls, collection):
-        _, *rest = collection
-        return rest
-
     def _make_some_sentences(self, ordered):
-        ordered = list(map(list, ordered))
         for sentence in ordered:
+            sentence = list(sentence)
             first_word = self._get_first(sentence)
             self._set_first(first_word, sentence)
-        return [f"{' '.join(sentence)}." for sentence in ordered]
+            yield f"{' '.join(sentence)}."
 
     def _set_first(self, first_word, sentence):
         # Only use digits for 10 and up, below is words e.g. five. Always capitalise the sentence.
         if isinstance(first_word, int):
             sentence[self._FIRST_WORD] = (
-                num2words(first_word).capitalize() if first_word < self._NUMBERS_AS_WORDS
+                to_words(first_word).capitalize() if first_word < self._NUMBERS_AS_WORDS
                 else str(first_word)
             )
         else:
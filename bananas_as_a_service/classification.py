@@ -0,0 +1,197 @@
+"""
+What is known about a word, as a small fixed-shape record rather than a nest of dicts e.g.:
+
+    Classification('bananas', Category.NOUN, features=[...], inflection=[...])
+
+Lexical categories are bits in an int, so asking whether a word is a noun, or throwing away every
+category Banana has no use for, is a single bitwise operation. Categories the Oxford API returns
+that aren't known here are kept by name so nothing is lost on the way back to storage.
+
+Records are never changed once made, which is what lets the caches share them rather than copy
+them. Convert to and from the dicts stored in DynamoDB, Redis and snapshots at those boundaries with
+`from_dict` and `to_dict`, e.g. {'categories': ['noun'], 'features': [...], 'inflection': [...]}.
+"""
+
+# pylint: disable=too-few-public-methods
+
+from functools import lru_cache
+
+
+class Category:
+    """A bit for each lexical category, as named by the Oxford Dictionaries API, and for numbers."""
+
+    NUMBER = 1 << 0
+    NOUN = 1 << 1
+    VERB = 1 << 2
+    ADJECTIVE = 1 << 3
+    ADVERB = 1 << 4
+    PREPOSITION = 1 << 5
+    PRONOUN = 1 << 6
+    DETERMINER = 1 << 7
+    CONJUNCTION = 1 << 8
+    INTERJECTION = 1 << 9
+    NUMERAL = 1 << 10
+    PARTICLE = 1 << 11
+    PREDETERMINER = 1 << 12
+    CONTRACTION = 1 << 13
+    COMBINING_FORM = 1 << 14
+    PREFIX = 1 << 15
+    SUFFIX = 1 << 16
+    IDIOMATIC = 1 << 17
+    RESIDUAL = 1 << 18
+    OTHER = 1 << 19
+
+    BY_NAME = {
+        'number': NUMBER,
+        'noun': NOUN,
+        'verb': VERB,
+        'adjective': ADJECTIVE,
+        'adverb': ADVERB,
+        'preposition': PREPOSITION,
+        'pronoun': PRONOUN,
+        'determiner': DETERMINER,
+        'conjunction': CONJUNCTION,
+        'interjection': INTERJECTION,
+        'numeral': NUMERAL,
+        'particle': PARTICLE,
+        'predeterminer': PREDETERMINER,
+        'contraction': CONTRACTION,
+        'combining form': COMBINING_FORM,
+        'prefix': PREFIX,
+        'suffix': SUFFIX,
+        'idiomatic': IDIOMATIC,
+        'residual': RESIDUAL,
+        'other': OTHER,
+    }
+
+    @classmethod
+    def from_names(cls, names):
+        """
+        Converts category names to a bitmask.
+
+        :param names: Lower case category names e.g. ['noun', 'verb']
+        :type names: :class: `list`
+        :return: Bitmask of the known categories, and the names of any that aren't known
+        :rtype: :class: `tuple`
+        """
+        mask = 0
+        unknown = []
+        for name in names:
+            category = cls.BY_NAME.get(name)
+            if category is None:
+                if name not in unknown:
+                    unknown.append(name)
+            else:
+                mask |= category
+        return mask, tuple(unknown)
+
+    @classmethod
+    def to_names(cls, mask):
+        """
+        Converts a bitmask to category names.
+
+        :param mask: Bitmask of categories
+        :type mask: :class: `int`
+        :return: Lower case category names, in the order of their bits
+        :rtype: :class: `tuple`
+        """
+        return _to_names(mask)
+
+
+@lru_cache(maxsize=None)
+def _to_names(mask):
+    # Only a handful of combinations ever turn up so remember each one.
+    return tuple(name for name, category in Category.BY_NAME.items() if mask & category)
+
+
+class Classification:
+    """Lexical categories, grammatical features and inflections of a word."""
+
+    __slots__ = ('word', 'categories', 'other_categories', 'features', 'inflection')
+
+    def __init__(self, word, categories=0, other_categories=(), features=None, inflection=None):
+        """
+        :param word: Word as it was asked for, numbers as ints
+        :type word: :class: `str` or `int`
+        :param categories: Bitmask of `Category`
+        :type categories: :class: `int`
+        :param other_categories: Names of categories without a `Category` bit
+        :type other_categories: :class: `tuple`
+        :param features: Grammatical features per lexical entry, None if never looked up
+        :type features: :class: `tuple`
+        :param inflection: Inflections per lexical entry, None if never looked up
+        :type inflection: :class: `tuple`
+        """
+        self.word = word
+        self.categories = categories
+        self.other_categories = other_categories
+        self.features = features
+        self.inflection = inflection
+
+    @classmethod
+    def from_dict(cls, word, value):
+        """
+        Converts the stored form of a classification into a record. Anything else stored alongside
+        e.g. the DynamoDB partition key, is dropped.
+
+        :param word: Word as it was asked for, numbers as ints
+        :type word: :class: `str` or `int`
+        :param value: Stored classification e.g. {'categories': ['noun'], 'features': [...]}
+        :type value: :class: `dict`
+        :return: Record
+        :rtype: :class: `Classification`
+        """
+        categories, other_categories = Category.from_names(value.get('categories') or ())
+        features = value.get('features')
+        inflection = value.get('inflection')
+        return cls(
+            word, categories, other_categories,
+            tuple(features) if features is not None else None,
+            tuple(inflection) if inflection is not None else None,
+        )
+
+    def to_dict(self):
+        """
+        Converts the record into the form it is stored in.
+
+        :return: Stored classification e.g. {'categories': ['noun'], 'features': [...]}
+        :rtype: :class: `dict`
+        """
+        value = {'categories': list(Category.to_names(self.categories) + self.other_categories)}
+        if self.features is not None:
+            value['features'] = list(self.features)
+        if self.inflection is not None:
+            value['inflection'] = list(self.inflection)
+        return value
+
+    def is_a(self, category):
+        """
+        Returns whether the word is in any of the categories.
+
+        :param category: Bitmask of `Category` e.g. Category.NOUN | Category.VERB
+        :type category: :class: `int`
+        :rtype: :class: `bool`
+        """
+        return bool(self.categories & category)
+
+    def restricted_to(self, categories):
+        """
+        Returns a copy with only the given categories kept.
+
+        :param categories: Bitmask of `Category` to keep
+        :type categories: :class: `int`
+        :rtype: :class: `Classification`
+        """
+        return Classification(
+            self.word, self.categories & categories, (), self.features, self.inflection)
+
+    def __eq__(self, other):
+        if not isinstance(other, Classification):
+            return NotImplemented
+        return all(getattr(self, slot) == getattr(other, slot) for slot in self.__slots__)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return (f"{type(self).__name__}({self.word!r}, "
+                f"{list(Category.to_names(self.categories) + self.other_categories)})")
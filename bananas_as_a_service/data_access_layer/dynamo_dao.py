@@ -3,41 +3,73 @@
 # pylint: disable=logging-fstring-interpolation
 
 import os
+import time
 
-import dpath
+from threading import Thread
 
-from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
 from botocore.exceptions import ClientError
-from num2words import num2words
-from word2number import w2n
-
+from bananas_as_a_service import instrumentation
 from bananas_as_a_service.aws import connect_to_aws_resource
 from bananas_as_a_service.app_logger import Logger
+from bananas_as_a_service.classification import Classification
+from bananas_as_a_service.environment import get_int
 from bananas_as_a_service.error_handler import GeneralError
+from bananas_as_a_service.number_words import to_words
 
 
 # FIXME: all this flipping of words to numbers and back seems pretty hackish
-# TODO: add a blacklist Dynamo table of nonsense words not found that will never be found
 class DynamoDAO:
     """
     Initialise with a list of words. These can be queried against DynamoDB. Words that are 'found'
     and 'not found' are saved to instance attributes. Accessors of the 'found' can use these to save
     a costly external API lookup; while 'not found' attributes can be looked up up elsewhere and
-    then saved to DynamoDB.
+    then saved to DynamoDB. Saving happens on a background thread so callers only wait for it
+    when they `flush`.
+
+    Nonsense words that the Oxford API will never find can be saved to an optional blacklist table.
+    Its items carry an `expires` epoch attribute for DynamoDB Time To Live so that words get another
+    chance eventually.
+
+    Every batch request is timed as a 'dynamodb.batch_get' or 'dynamodb.batch_write' span.
+
+    Items are converted to and from `Classification` records here, so nothing else sees them.
+
+    Requests go through the client of the shared boto3 resource, as the writer thread and any
+    lookups made concurrently use it at the same time and, unlike resources, clients are
+    thread-safe. The client takes and returns DynamoDB's typed attribute values e.g. {'S': 'five'}.
     """
 
+    _BATCH_GET_LIMIT = 100  # Hard limit of keys per BatchGetItem request imposed by DynamoDB
+    _BATCH_WRITE_LIMIT = 25  # Hard limit of items per BatchWriteItem request imposed by DynamoDB
+    _MAX_RETRIES = 5
+    _BACKOFF_BASE = 0.05  # Seconds, doubled on each retry of unprocessed keys
+    _DEFAULT_BLACKLIST_TTL = 604800  # Seconds
+    _EXPIRES = 'expires'
+    _serializer = TypeSerializer()
+    _deserializer = TypeDeserializer()
+
     def __init__(self, words):
         self._logger = Logger().get_logger()
         self._words = words
         self._found = []
         self._not_found = []
-        self._resource = connect_to_aws_resource('dynamodb')
-        self._table = self._get_table()
+        self._write_metrics = []
+        self._writers = []
+        self._client = connect_to_aws_resource('dynamodb').meta.client
+        self._table_name = self._get_table_name()
+        self._blacklist_table_name = os.environ.get('BLACKLIST_TABLE_NAME')
+        self._blacklist_ttl = get_int('BLACKLIST_TTL', self._DEFAULT_BLACKLIST_TTL)
         self._partition_key = self._get_partition_key()
 
+    @property
+    def words(self):
+        """Returns words to be looked up in DynamoDB."""
+        return self._words
+
     @property
     def found(self):
-        """Returns words that are found in DynamoDB."""
+        """Returns classifications of words that are found in DynamoDB."""
         return self._found
 
     @property
@@ -45,7 +77,11 @@ class DynamoDAO:
         """Returns words that are not found in DynamoDB."""
         return self._not_found
 
-    # TODO: multi-thread this lookup
+    @property
+    def write_metrics(self):
+        """Returns items written, retried and failed per BatchWriteItem batch."""
+        return self._write_metrics
+
     def check_storage(self):
         """
         Looks up DynamoDB for metadata about word.
@@ -55,70 +91,124 @@ class DynamoDAO:
         side. Numbers to words and vice versa. This is because the OxfordDAO is well equipped to
         handle both kinds of "numbers" and DynamoDB is just for storage and retrieval purposes. Keep
         the AI tamed to a single place, lest we unleash the Machine Apocalypse.
+
+        Words are looked up in chunks of up to 100 keys per BatchGetItem request, so latency scales
+        with the number of batches rather than the number of words.
         """
         self._logger.info(f"Checking DynamoDB storage for: {self._words}")
+        self.lookup(self._words)
 
-        for word in self._words:
-            is_number, word = self._is_a_number(word)
-
-            response = self._query_item(self._partition_key, word)
-            if response.get('Count'):
-                word = dpath.get(response, 'Items/*/word')
-                self._logger.info(f"Word found in DynamoDB: {word}")
-                item = {word: dpath.get(response, 'Items/*')}
+    def lookup(self, words):
+        """
+        Looks up DynamoDB for a subset of words, adding them to the 'found' and 'not found'.
 
-                if is_number:
-                    value = item.get(word)
-                    word = w2n.word_to_num(word)
-                    item = {word: value}
+        :param words: Words to look up
+        :type words: :class: `list`
+        :return: Words found and not found by this lookup
+        :rtype: :class: `tuple`
+        """
+        # Map the stored (string) key back to the word as it was passed in e.g. 'five' -> 5.
+        keys = {}
+        for word in words:
+            key = self._key(word)
+            keys.setdefault(key, word)
 
-                self._found.append(item)
+        found = []
+        not_found = []
+        items = self._get_items(self._table_name, list(keys))
+        for key, word in keys.items():
+            item = items.get(key)
+            if item:
+                self._logger.info(f"Word found in DynamoDB: {key}")
+                found.append(Classification.from_dict(word, item))
             else:
-                self._logger.info(f"Word not found in DynamoDB: {word}")
+                self._logger.info(f"Word not found in DynamoDB: {key}")
+                not_found.append(word)
 
-                if is_number:
-                    word = w2n.word_to_num(word)
+        self._found.extend(found)
+        self._not_found.extend(not_found)
+        return found, not_found
 
-                self._not_found.append(word)
-
-    # TODO: multi-thread this put
     def update_storage(self, oxford_classifications):
         """
         Stores Oxford provided classifications to DynamoDB.
 
         See docstring for check_storage(): why we do all this string to int and back again madness.
 
-        :param oxford_classifications:
-        :type oxford_classifications: :class: list
+        Items are written in batches of up to 25 on a background thread so the response isn't held
+        up by DynamoDB. Call flush() before the process finishes to wait for the writes to land.
+
+        :param oxford_classifications: Classifications to store
+        :type oxford_classifications: :class: `list` of :class: `Classification`
         """
         self._logger.info(f"Updating DynamoDB storage for: {oxford_classifications}")
 
+        items = {}
         for classification in oxford_classifications:
-            word, *_ = list(classification)
-            is_number, word = self._is_a_number(word)
-            item = {self._partition_key: word}
+            key = self._key(classification.word)
+            item = {self._partition_key: key}
+            item.update(classification.to_dict())
+            items[key] = item  # BatchWriteItem rejects duplicate keys in the one request
 
-            if is_number:
-                word = w2n.word_to_num(word)
+        self._start_writer(self._table_name, list(items.values()))
 
-            item.update(classification.get(word))
-            # TODO: move put_item to AWS for consistency
-            try:
-                self._table.put_item(Item=item)
-            except ClientError as exc:
-                raise GeneralError(f"ClientError with DynamoDB put: {exc}")
-            else:
-                if is_number:
-                    word = num2words(word)
-                self._logger.info(f"Updated DynamoDB with word: {word}")
+    def check_blacklist(self, words):
+        """
+        Looks up the blacklist table for words the Oxford API has previously failed to find.
+
+        DynamoDB only removes expired items within a couple of days of them expiring, so the expiry
+        is checked here as well.
+
+        :param words: Words to look up
+        :type words: :class: `list`
+        :return: Words that are blacklisted
+        :rtype: :class: `list`
+        """
+        words = [word for word in words if isinstance(word, str)]  # Numbers are never blacklisted
+        if not self._blacklist_table_name or not words:
+            return []
+
+        items = self._get_items(self._blacklist_table_name, words)
+        now = time.time()
+        blacklisted = [word for word in words if items.get(word, {}).get(self._EXPIRES, 0) > now]
+        if blacklisted:
+            self._logger.info(f"Word(s) found in DynamoDB blacklist: {blacklisted}")
+        return blacklisted
+
+    def update_blacklist(self, words):
+        """
+        Stores words the Oxford API couldn't find in the blacklist table, in the background.
+
+        :param words: Words not found
+        :type words: :class: `list`
+        """
+        if not self._blacklist_table_name or not words:
+            return
+
+        self._logger.info(f"Updating DynamoDB blacklist for: {words}")
+        expires = int(time.time()) + self._blacklist_ttl
+        items = [{self._partition_key: word, self._EXPIRES: expires} for word in set(words)]
+        self._start_writer(self._blacklist_table_name, items)
+
+    def flush(self):
+        """
+        Waits for any background DynamoDB writes to finish.
 
-    def _get_table(self):
+        :return: Items written, retried and failed per batch
+        :rtype: :class: `list`
+        """
+        while self._writers:
+            self._writers.pop().join()
+        return self._write_metrics
+
+    @classmethod
+    def _get_table_name(cls):
         try:
-            table = self._resource.Table(os.environ['TABLE_NAME'])
+            table_name = os.environ['TABLE_NAME']
         except KeyError:
             raise GeneralError("Missing DynamoDB table name environment variable")
         else:
-            return table
+            return table_name
 
     @classmethod
     def _get_partition_key(cls):
@@ -129,14 +219,96 @@ class DynamoDAO:
         else:
             return partition_key
 
-    def _query_item(self, key_name, key_value):
-        try:
-            response = self._table.query(KeyConditionExpression=Key(key_name).eq(key_value))
-        except ClientError as exc:
-            raise GeneralError(f"ClientError with DynamoDB query: {exc}")
-        else:
-            return response
+    def _get_items(self, table_name, keys):
+        items = {}
+        for start in range(0, len(keys), self._BATCH_GET_LIMIT):
+            batch = keys[start:start + self._BATCH_GET_LIMIT]
+            for item in self._batch_get_items(table_name, batch):
+                items[item.get(self._partition_key)] = item
+        return items
+
+    def _batch_get_items(self, table_name, batch):
+        # DynamoDB may hand back some keys unprocessed when throttled; retry those with backoff.
+        request_items = {
+            table_name: {'Keys': [self._to_attributes({self._partition_key: key}) for key in batch]}
+        }
+        items = []
+        for attempt in range(self._MAX_RETRIES + 1):
+            try:
+                with instrumentation.span('dynamodb.batch_get'):
+                    response = self._client.batch_get_item(RequestItems=request_items)
+            except ClientError as exc:
+                raise GeneralError(f"ClientError with DynamoDB batch get: {exc}")
+
+            items.extend(
+                self._from_attributes(item)
+                for item in response.get('Responses', {}).get(table_name, []))
+            request_items = response.get('UnprocessedKeys')
+            if not request_items:
+                return items
+
+            unprocessed = len(request_items.get(table_name, {}).get('Keys', []))
+            instrumentation.increment('dynamodb.get_retried', unprocessed)
+            self._logger.info(
+                f"Retrying {unprocessed} unprocessed DynamoDB key(s), attempt: {attempt + 1}")
+            time.sleep(self._BACKOFF_BASE * 2 ** attempt)
+
+        raise GeneralError(f"DynamoDB batch get left keys unprocessed: {request_items}")
+
+    def _start_writer(self, table_name, items):
+        writer = Thread(target=self._write_items, args=(table_name, items))
+        writer.start()
+        self._writers.append(writer)
+
+    def _write_items(self, table_name, items):
+        for start in range(0, len(items), self._BATCH_WRITE_LIMIT):
+            batch = items[start:start + self._BATCH_WRITE_LIMIT]
+            with instrumentation.span('dynamodb.batch_write'):
+                metrics = self._batch_write_items(table_name, batch)
+            for key in ('written', 'retried', 'failed'):
+                instrumentation.increment(f'dynamodb.{key}', metrics.get(key))
+            self._write_metrics.append(metrics)
+            self._logger.info(f"DynamoDB batch write: {metrics}")
+
+    def _batch_write_items(self, table_name, batch):
+        # Mirror of _batch_get_items for writes, except failures are counted rather than raised as
+        # nobody is waiting on this thread to catch them.
+        metrics = {'table': table_name, 'written': 0, 'retried': 0, 'failed': 0}
+        request_items = {
+            table_name: [{'PutRequest': {'Item': self._to_attributes(item)}} for item in batch]
+        }
+        for attempt in range(self._MAX_RETRIES + 1):
+            pending = request_items.get(table_name)
+            try:
+                response = self._client.batch_write_item(RequestItems=request_items)
+            except ClientError as exc:
+                self._logger.error(f"ClientError with DynamoDB batch write: {exc}")
+                metrics['failed'] += len(pending)
+                return metrics
+
+            unprocessed = response.get('UnprocessedItems', {}).get(table_name, [])
+            metrics['written'] += len(pending) - len(unprocessed)
+            if not unprocessed:
+                return metrics
+            if attempt == self._MAX_RETRIES:
+                break
+
+            metrics['retried'] += len(unprocessed)
+            request_items = {table_name: unprocessed}
+            time.sleep(self._BACKOFF_BASE * 2 ** attempt)
+
+        self._logger.error(f"DynamoDB batch write left items unprocessed: {unprocessed}")
+        metrics['failed'] += len(unprocessed)
+        return metrics
+
+    @classmethod
+    def _to_attributes(cls, item):
+        return {name: cls._serializer.serialize(value) for name, value in item.items()}
+
+    @classmethod
+    def _from_attributes(cls, item):
+        return {name: cls._deserializer.deserialize(value) for name, value in item.items()}
 
     @classmethod
-    def _is_a_number(cls, word):
-        return (True, num2words(word)) if isinstance(word, int) else (False, word)
+    def _key(cls, word):
+        return to_words(word) if isinstance(word, int) else word
@@ -1,23 +1,86 @@
-"""Abstraction object for accessing lexical data about words from Oxford Dictionaries API."""
+"""
+Abstraction object for accessing lexical data about words from Oxford Dictionaries API.
 
-# pylint: disable=logging-fstring-interpolation, too-few-public-methods
+Each request is timed as an 'oxford.request' span and time spent waiting on the rate limiter as an
+'oxford.throttled' span.
+"""
 
-from threading import Thread
+# pylint: disable=invalid-name, logging-fstring-interpolation, too-few-public-methods
+
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
 
 import dpath
 import requests
 
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException
 
+from bananas_as_a_service import instrumentation
 from bananas_as_a_service.app_logger import Logger
 from bananas_as_a_service.aws import get_from_parameter_store
+from bananas_as_a_service.classification import Category, Classification
+from bananas_as_a_service.environment import get_int
 from bananas_as_a_service.error_handler import GeneralError
 
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_REQUESTS_PER_MINUTE = 60  # Oxford Dictionaries API free tier quota
+
+
+class RateLimiter:
+    """
+    Token bucket which blocks callers so that no more than `per_minute` requests are made in any
+    minute. A full minute's worth of tokens may be spent at once, after which they trickle back.
+    """
+
+    def __init__(self, per_minute):
+        """
+        :param per_minute: Requests allowed per minute, zero or less disables limiting
+        :type per_minute: :class: `int`
+        """
+        self._capacity = per_minute
+        self._tokens = float(per_minute)
+        self._refill_rate = per_minute / 60  # Tokens per second
+        self._updated = time.monotonic()
+        self._lock = Lock()
+
+    def acquire(self):
+        """Blocks until a request may be made."""
+        if self._capacity <= 0:
+            return
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self._capacity, self._tokens + (now - self._updated) * self._refill_rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self._refill_rate
+            time.sleep(wait)
+
+
+def _create_session(pool_size):
+    # One keep-alive connection per worker so warm invocations skip the TLS handshake.
+    pooled_session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    pooled_session.mount('https://', adapter)
+    return pooled_session
+
+
+# Module level so that warm Lambda invocations share connections and the API quota.
+max_workers = get_int('OXFORD_MAX_WORKERS', DEFAULT_MAX_WORKERS)
+session = _create_session(max_workers)
+rate_limiter = RateLimiter(get_int('OXFORD_REQUESTS_PER_MINUTE', DEFAULT_REQUESTS_PER_MINUTE))
+
 
 class OxfordDAO:
     """Data Access Object for making requests to the Oxford Dictionaries API."""
 
-    # TODO: investigate data classes
     _BASE_URL = 'https://od-api.oxforddictionaries.com:443/api/v1/inflections/en/'
     _TO_PARSE = {
         'categories': 'lexicalCategory',
@@ -26,14 +89,22 @@ class OxfordDAO:
     }
     _HTTP_OK = 200
     _HTTP_FORBIDDEN = 403
+    _HTTP_NOT_FOUND = 404
+    _HTTP_TOO_MANY_REQUESTS = 429
+    _MAX_RETRIES = 2
 
     def __init__(self):
         self._logger = Logger().get_logger()
         self._results = None
         self._words_not_found = 0
-        self._app_id = None
-        self._app_key = None
-        self._load_credentials()
+        self._not_found = []
+        self._lock = Lock()
+        self._app_id, self._app_key = self._load_credentials()
+
+    @property
+    def not_found(self):
+        """Returns words that the Oxford API definitively does not know about."""
+        return self._not_found
 
     def classify(self, tokens):
         """
@@ -42,6 +113,8 @@ class OxfordDAO:
         As we are hitting an external API for every single word to classify, and calls to that API
         take about a second each, and each of these calls is I/O bound, and none of those calls can
         cause a race condition, let's go ahead and get all multi-threaded all up in this hizzle.
+        Within reason though: a bounded pool of OXFORD_MAX_WORKERS threads shares one keep-alive
+        session, and requests are throttled to OXFORD_REQUESTS_PER_MINUTE to stay inside the quota.
 
         Big shout out to these two MT-spirational peeps:
         https://www.shanelynn.ie/using-python-threading-for-multiple-results-queue/
@@ -50,24 +123,23 @@ class OxfordDAO:
         :param tokens: Words to be classified
         :type tokens: :class: `list`
         :return: Lexical information about words
-        :rtype: :class: `list`
+        :rtype: :class: `list` of :class: `Classification`
         """
         self._logger.info(f"Classifying tokens: {tokens}")
-        # TODO: use `Queue` for batching to prevent error and to make event driven
-
-        app_id, app_key = self._load_credentials()
-        self._results = [{} for _ in tokens]
-        threads = []
-        for index, token in enumerate(tokens):
-            if isinstance(token, int):
-                self._results[index] = {token: {'categories': ['number']}}
-            else:
-                thread = Thread(target=self._request_from_api, args=(token, index, app_id, app_key))
-                thread.start()
-                threads.append(thread)
-
-        for thread in threads:
-            thread.join()
+
+        self._results = [None for _ in tokens]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {}
+            for index, token in enumerate(tokens):
+                if isinstance(token, int):
+                    self._results[index] = Classification(token, Category.NUMBER)
+                else:
+                    futures[index] = executor.submit(
+                        self._request_from_api, token, self._app_id, self._app_key)
+
+            for index, future in futures.items():
+                # Re-raises anything unexpected e.g. incorrect app credentials
+                self._results[index] = future.result()
 
         if self._words_not_found:
             self._logger.info(f"Number of word(s) not found: {self._words_not_found}")
@@ -78,31 +150,63 @@ class OxfordDAO:
         self._logger.info(f"Word(s) processed from OxfordDAO: {len(self._results)}")
         return [result for result in self._results if result]
 
+    def classify_token(self, token):
+        """
+        Request and parse a single word, for callers managing their own concurrency.
+
+        :param token: Word to be classified
+        :type token: :class: `str` or `int`
+        :return: Lexical information about the word, None if it couldn't be found
+        :rtype: :class: `Classification`
+        """
+        if isinstance(token, int):
+            return Classification(token, Category.NUMBER)
+        return self._request_from_api(token, self._app_id, self._app_key)
+
     @classmethod
     def _load_credentials(cls):
         ssm_parameters = get_from_parameter_store(['app_id', 'app_key'])
         return ssm_parameters['app_id'], ssm_parameters['app_key']
 
-    def _request_from_api(self, token, index, app_id, app_key):
+    def _request_from_api(self, token, app_id, app_key):
         word = {}
         try:
-            response = requests.get(
-                f'{self._BASE_URL}{token.lower()}',
-                headers={'app_id': app_id, 'app_key': app_key}
-            )
+            response = self._get(token, app_id, app_key)
             if response.status_code == self._HTTP_FORBIDDEN:
                 raise GeneralError("Incorrect app credentials")
             if response.status_code != self._HTTP_OK:
-                self._words_not_found += 1
-                raise RequestException
+                with self._lock:
+                    if response.status_code == self._HTTP_NOT_FOUND:
+                        self._not_found.append(token)
+                    self._words_not_found += 1
+                raise RequestException(f"HTTP status code: {response.status_code}")
         except RequestException as exc:
             self._logger.error(
                 f"Unable to get word: '{token}' from API due to: {exc}", exc_info=True)
-            self._results[index] = {}
+            return None
         else:
             word = self._categorise(response, word)
-            self._results[index] = {token: word}
-        return True
+            return Classification.from_dict(token, word)
+
+    def _get(self, token, app_id, app_key):
+        # Back off and try again if we have blown through the quota despite the rate limiter.
+        for attempt in range(self._MAX_RETRIES + 1):
+            with instrumentation.span('oxford.throttled'):
+                rate_limiter.acquire()
+            with instrumentation.span('oxford.request'):
+                response = session.get(
+                    f'{self._BASE_URL}{token.lower()}',
+                    headers={'app_id': app_id, 'app_key': app_key}
+                )
+            if response.status_code != self._HTTP_TOO_MANY_REQUESTS or attempt == self._MAX_RETRIES:
+                return response
+
+            retry_after = response.headers.get('Retry-After', '')
+            wait = int(retry_after) if retry_after.isdigit() else 2 ** attempt
+            instrumentation.increment('oxford.rate_limited')
+            self._logger.info(f"Oxford API rate limited, retrying '{token}' in {wait}s")
+            time.sleep(wait)
+        return response
 
     def _categorise(self, response, word):
         for key, value in self._TO_PARSE.items():
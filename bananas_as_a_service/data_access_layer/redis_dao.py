@@ -0,0 +1,136 @@
+"""
+Data Access Object for a remote cache speaking the Redis protocol e.g. ElastiCache. It sits between
+the in-process LexicalCache and DynamoDB. The cache is entirely optional: it is only used when the
+CACHE_URL environment variable is set and the `redis` package is installed, and any error talking to
+it is logged and treated as a miss so that lookups carry on to DynamoDB. The package isn't in
+requirements.txt, install requirements-cache.txt as well to deploy with a cache.
+
+Round trips are timed as 'redis.get' and 'redis.update' spans and errors counted as 'redis.errors'.
+"""
+
+# pylint: disable=invalid-name, logging-fstring-interpolation, broad-except, global-statement
+# pylint: disable=import-outside-toplevel
+
+import json
+import os
+
+from bananas_as_a_service import instrumentation
+from bananas_as_a_service.app_logger import Logger
+from bananas_as_a_service.classification import Classification
+from bananas_as_a_service.environment import get_int
+from bananas_as_a_service.error_handler import GeneralError
+
+logger = Logger().get_logger()
+
+DEFAULT_TTL = 86400  # Seconds
+DEFAULT_TIMEOUT = 0.2  # Seconds, keep short as a slow cache is worse than no cache
+
+# Module level so that warm Lambda invocations re-use the connection pool.
+_client = None
+
+
+def connect_to_cache():
+    """
+    Returns a Redis client for CACHE_URL, or None if no cache is configured or available.
+
+    :return: Redis client
+    :rtype: :class: `redis.Redis` or `NoneType`
+    """
+    global _client
+
+    url = os.environ.get('CACHE_URL')
+    if _client is not None or not url:
+        return _client
+
+    try:
+        import redis
+    except ImportError:
+        logger.warning("CACHE_URL is set but the redis package is not installed")
+        return None
+
+    try:
+        timeout = float(os.environ.get('CACHE_TIMEOUT', DEFAULT_TIMEOUT))
+    except ValueError as err:
+        raise GeneralError(f"Invalid cache timeout environment variable: {err}")
+
+    logger.info(f"Attempting connection to cache: {url}")
+    _client = redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+    return _client
+
+
+class RedisDAO:
+    """
+    Looks up and stores classifications in a Redis protocol cache. Pass in a client e.g. a fakeredis
+    instance to use a stand-in; otherwise one is created from the environment.
+    """
+
+    _KEY_PREFIX = 'banana:word:'
+
+    def __init__(self, client=None):
+        self._logger = Logger().get_logger()
+        self._client = client if client is not None else connect_to_cache()
+        self._ttl = get_int('CACHE_TTL', DEFAULT_TTL)
+
+    @property
+    def enabled(self):
+        """Returns whether there is a cache to talk to."""
+        return self._client is not None
+
+    def check_cache(self, words):
+        """
+        Fetches classifications for all the words in a single MGET.
+
+        :param words: Words to look up
+        :type words: :class: `list`
+        :return: Classifications of the words that were cached, keyed by word
+        :rtype: :class: `dict`
+        """
+        if not self.enabled or not words:
+            return {}
+
+        try:
+            with instrumentation.span('redis.get'):
+                values = self._client.mget([self._key(word) for word in words])
+        except Exception as exc:
+            instrumentation.increment('redis.errors')
+            self._logger.warning(f"Cache unavailable, falling back to DynamoDB: {exc}")
+            return {}
+
+        found = {
+            word: Classification.from_dict(word, json.loads(value))
+            for word, value in zip(words, values) if value
+        }
+        self._logger.info(f"Word(s) found in cache: {len(found)}")
+        return found
+
+    def update_cache(self, classifications):
+        """
+        Stores classifications with an expiry using a single pipelined MSET and EXPIRE round trip.
+
+        :param classifications: Lexical information about words
+        :type classifications: :class: `list` of :class: `Classification`
+        """
+        if not self.enabled or not classifications:
+            return
+
+        mapping = {
+            self._key(classification.word): json.dumps(classification.to_dict(), default=str)
+            for classification in classifications
+        }
+
+        try:
+            with instrumentation.span('redis.update'):
+                pipeline = self._client.pipeline(transaction=False)
+                pipeline.mset(mapping)
+                for key in mapping:
+                    pipeline.expire(key, self._ttl)
+                pipeline.execute()
+        except Exception as exc:
+            instrumentation.increment('redis.errors')
+            self._logger.warning(f"Cache unavailable, skipping cache update: {exc}")
+        else:
+            self._logger.info(f"Updated cache with word(s): {len(mapping)}")
+
+    @classmethod
+    def _key(cls, word):
+        return f'{cls._KEY_PREFIX}{word}'
@@ -0,0 +1,24 @@
+"""Reads settings from environment variables, so that a bad value fails the same way everywhere."""
+
+import os
+
+from bananas_as_a_service.error_handler import GeneralError
+
+
+def get_int(name, default):
+    """
+    Reads an integer from an environment variable.
+
+    :param name: Name of the environment variable e.g. 'LEXICAL_CACHE_TTL'
+    :type name: :class: `str`
+    :param default: Used when the environment variable isn't set
+    :type default: :class: `int`
+    :return: Value of the environment variable
+    :rtype: :class: `int`
+    """
+    try:
+        value = int(os.environ.get(name, default))
+    except ValueError as err:
+        raise GeneralError(f"Invalid {name} environment variable: {err}")
+    else:
+        return value
@@ -4,3 +4,8 @@
 class GeneralError(Exception):
     """Generic error type."""
     pass
+
+
+class CursorError(GeneralError):
+    """Cursor that doesn't point at a sentence of the phrases it was passed with."""
+    pass
@@ -0,0 +1,287 @@
+"""
+Orders classified words into sentences following grammar templates. A template is a sequence of
+lexical categories, one slot per word, e.g. number adverb adjective noun. The defaults are that and
+the same again without the number, as having no number at the start of an otherwise valid sentence
+is legit English. Set GRAMMAR_TEMPLATES to use others, templates separated by ';' and categories by
+spaces e.g. "number adverb adjective noun; adjective adjective noun".
+
+Words are put in an index of category to words in a single pass, sorted within each category so
+the same words always give the same sentences in the same order. Slots of categories with no words
+are left out, and a template that ends up the same as an earlier one is skipped.
+
+A word can be in more than one category, e.g. "easy" is both an adverb and an adjective, but is
+never used twice in a sentence. Where a slot could only repeat a word already in the sentence it is
+left empty instead. Each sentence is generated only once and never needs to be checked against the
+ones before it, so nothing but the sentence being made is held in memory however many there are:
+  - within a template, each word is placed in the earliest slot it can go in. A slot is left empty
+    only when one of its words is already in the sentence, and a word in an emptied slot can't be
+    placed straight after it, as it would have gone in that slot instead
+  - a sentence from a later template is dropped if an earlier template could have made it, which is
+    a check of the one sentence against the earlier templates' slots
+
+Every sentence has a position: the number of its template and, for each slot, the index of the word
+chosen in it (or where the slot was left empty). Sentences are made in order of position, so making
+them can carry on straight after any position without making the ones before it again. A position
+is worked out from its sentence only when asked for, so making sentences costs no more for it.
+"""
+
+# pylint: disable=invalid-name
+
+import os
+
+from functools import partial
+
+from bananas_as_a_service.classification import Category
+from bananas_as_a_service.error_handler import GeneralError
+
+DEFAULT_TEMPLATES = (
+    ('number', 'adverb', 'adjective', 'noun'),
+    ('adverb', 'adjective', 'noun'),
+)
+
+
+class Grammar:
+    """Grammar templates and the sentences they make from classified words."""
+
+    def __init__(self, templates=DEFAULT_TEMPLATES):
+        """
+        :param templates: Category names for each slot of each template e.g. [['adjective', 'noun']]
+        :type templates: :class: `list`
+        """
+        self._templates = []
+        for template in templates:
+            if not template:
+                raise GeneralError("Grammar templates must have at least one category")
+            try:
+                self._templates.append(
+                    tuple(Category.BY_NAME[name.replace('_', ' ')] for name in template))
+            except KeyError as err:
+                raise GeneralError(f"Unknown category in grammar template: {err}")
+        if not self._templates:
+            raise GeneralError("There must be at least one grammar template")
+
+        self._slot_categories = list(dict.fromkeys(
+            category for template in self._templates for category in template))
+        self._categories = 0
+        for category in self._slot_categories:
+            self._categories |= category
+
+    @classmethod
+    def from_environment(cls):
+        """
+        Creates a grammar from the GRAMMAR_TEMPLATES environment variable, or the defaults.
+
+        :return: Configured grammar
+        :rtype: :class: `Grammar`
+        """
+        templates = os.environ.get('GRAMMAR_TEMPLATES', '').strip()
+        if not templates:
+            return cls()
+        # A trailing or doubled ';' is a slip, not a template with no slots.
+        return cls([
+            template.lower().split() for template in templates.split(';') if template.strip()
+        ])
+
+    @property
+    def categories(self):
+        """Returns a bitmask of every category used by the templates."""
+        return self._categories
+
+    def index(self, classified):
+        """
+        Groups words by the categories the templates use.
+
+        :param classified: Lexical information about words
+        :type classified: :class: `list` of :class: `Classification`
+        :return: Sorted words keyed by category, only categories with words
+        :rtype: :class: `dict`
+        """
+        index = {}
+        for classification in classified:
+            if not classification.categories & self._categories:
+                continue
+            for category in self._slot_categories:
+                if classification.categories & category:
+                    index.setdefault(category, []).append(classification.word)
+
+        for words in index.values():
+            words.sort(key=self._sort_key)
+        return index
+
+    def estimate_count(self, index):
+        """
+        Returns an upper bound on the number of sentences without making any of them. Words in more
+        than one category mean there may be fewer.
+
+        :param index: Words keyed by category, as returned by `index`
+        :type index: :class: `dict`
+        :rtype: :class: `int`
+        """
+        total = 0
+        for template in self._reduce(index):
+            count = 1
+            for category in template:
+                count *= len(index[category])
+            total += count
+        return total
+
+    def sentences(self, index, after=None):
+        """
+        Makes every sentence the templates allow, lazily, in a stable order.
+
+        :param index: Words keyed by category, as returned by `index`
+        :type index: :class: `dict`
+        :param after: Position of a sentence to carry on from, starting with the one after it
+        :type after: :class: `tuple`
+        :return: Sentences as tuples of words
+        :rtype: :class: `generator`
+        :raises ValueError: If the position isn't one of these templates and words
+        """
+        templates = self._reduce(index)
+        if after is not None:
+            self._check_position(index, templates, after)
+        return self._sentences(index, templates, after)
+
+    def position(self, index, sentence):
+        """
+        Returns the position of a sentence, to carry on from it later with `sentences`.
+
+        :param index: Words keyed by category, as returned by `index`
+        :type index: :class: `dict`
+        :param sentence: Sentence made by `sentences` from the same index
+        :type sentence: :class: `tuple`
+        :return: Template number and the index chosen in each slot
+        :rtype: :class: `tuple`
+        """
+        # A sentence is only made by the first template that can make it.
+        for number, template in enumerate(self._reduce(index)):
+            slots = [index[category] for category in template]
+            if self._can_make([frozenset(words) for words in slots], sentence):
+                return number, self._choices(slots, sentence)
+        raise ValueError(f"Not a sentence of these words: {sentence}")
+
+    def _sentences(self, index, templates, after):
+        earlier = []
+        for number, template in enumerate(templates):
+            slots = [index[category] for category in template]
+            members = [frozenset(words) for words in slots]
+            if after is None or number > after[0]:
+                made = self._generate(slots, members, 0, [], set(), frozenset())
+            elif number == after[0]:
+                made = self._carry_on(after[1], slots, members)
+            else:
+                made = ()
+            for sentence in made:
+                if not any(self._can_make(other, sentence) for other in earlier):
+                    yield sentence
+            earlier.append(members)
+
+    def _reduce(self, index):
+        # Leave out slots with no words, then templates with no slots or the same as another.
+        reduced = []
+        for template in self._templates:
+            template = tuple(category for category in template if index.get(category))
+            if template and template not in reduced:
+                reduced.append(template)
+        return reduced
+
+    @classmethod
+    def _check_position(cls, index, templates, position):
+        number, choices = position
+        if not 0 <= number < len(templates):
+            raise ValueError(f"no template {number}")
+        template = templates[number]
+        if len(choices) != len(template):
+            raise ValueError(f"template {number} has {len(template)} slot(s) not {len(choices)}")
+        for slot, (category, choice) in enumerate(zip(template, choices)):
+            if not 0 <= choice < len(index[category]):
+                raise ValueError(f"no word {choice} in slot {slot} of template {number}")
+
+    def _generate(self, slots, members, position, sentence, used, forbidden):
+        # Depth first through the slots, so only the sentence being made is ever held.
+        if position == len(slots):
+            yield tuple(sentence)
+            return
+
+        skipped = False
+        for word in slots[position]:
+            if word in used:
+                # The slot can only repeat a word so is left empty, once, where that word sorts.
+                if not skipped:
+                    skipped = True
+                    yield from self._generate(
+                        slots, members, position + 1, sentence, used,
+                        forbidden | members[position])
+            elif word not in forbidden:
+                sentence.append(word)
+                used.add(word)
+                yield from self._generate(
+                    slots, members, position + 1, sentence, used, frozenset())
+                used.discard(word)
+                sentence.pop()
+
+    def _carry_on(self, start, slots, members):
+        made = self._resume(start, slots, members, 0, [], set(), frozenset())
+        # The first is the one at start, already made, unless start was never made.
+        first = next(made, None)
+        if first is not None and self._choices(slots, first) != start:
+            yield first
+        yield from made
+
+    def _resume(self, start, slots, members, position, sentence, used, forbidden):
+        # The same walk as _generate, but each slot down the first branch begins at its index in
+        # start. Every later branch is walked from its beginning, so is left to _generate.
+        if position == len(slots):
+            yield tuple(sentence)
+            return
+
+        words = slots[position]
+        first = start[position]
+        # Carrying on part way through a slot, it was already left empty if a word before was.
+        skipped = any(word in used for word in words[:first])
+        for choice in range(first, len(words)):
+            word = words[choice]
+            walk = partial(self._resume, start) if choice == first else self._generate
+            if word in used:
+                if not skipped:
+                    skipped = True
+                    yield from walk(
+                        slots, members, position + 1, sentence, used,
+                        forbidden | members[position])
+            elif word not in forbidden:
+                sentence.append(word)
+                used.add(word)
+                yield from walk(slots, members, position + 1, sentence, used, frozenset())
+                used.discard(word)
+                sentence.pop()
+
+    @classmethod
+    def _choices(cls, slots, sentence):
+        # Each word went in the earliest slot it could, and an empty slot is where its first word
+        # already in the sentence sorts, so the choices can be worked out from the sentence alone.
+        choices = []
+        placed = 0
+        for words in slots:
+            if placed < len(sentence) and sentence[placed] in words:
+                choices.append(words.index(sentence[placed]))
+                placed += 1
+            else:
+                used = sentence[:placed]
+                choices.append(next(choice for choice, word in enumerate(words) if word in used))
+        return tuple(choices)
+
+    @classmethod
+    def _can_make(cls, members, sentence):
+        # Placing each word in the earliest slot it fits is always possible if any placement is.
+        position = 0
+        for slot in members:
+            if position < len(sentence) and sentence[position] in slot:
+                position += 1
+            elif slot.isdisjoint(sentence[:position]):
+                return False
+        return position == len(sentence)
+
+    @classmethod
+    def _sort_key(cls, word):
+        # Numbers first then words, as an int can't be compared to a str.
+        return (0, word, '') if isinstance(word, int) else (1, 0, str(word))
@@ -0,0 +1,243 @@
+"""
+Lightweight instrumentation of where the time goes in a request. Stages of Banana and every call out
+to DynamoDB, Redis and the Oxford API are timed as spans, and interesting things are counted e.g.
+cache hits, words not found, sentences made. Spans are summed per name, so calls made concurrently
+add up to the time spent in them rather than the wall clock time.
+
+The recorder is module level and thread safe, as the DAOs do their I/O from worker threads. The
+lambda_handler resets it at the start of each invocation and publishes it to the sinks at the end:
+  - `EmfSink` prints CloudWatch Embedded Metric Format JSON to stdout, which Lambda sends to
+    CloudWatch Logs to be turned into metrics. Enabled by setting METRICS_NAMESPACE. Where stdout
+    is output of its own, e.g. go_bananas.py --ndjson, use `set_emf_stream` to write it elsewhere.
+  - `InMemorySink` keeps every snapshot published to it, for tests e.g.:
+
+    sink = InMemorySink()
+    add_sink(sink)
+    lambda_handler(event, None)
+    sink.records[-1].get('counts').get('banana.sentences')
+"""
+
+# pylint: disable=invalid-name, global-statement, too-few-public-methods
+
+import json
+import os
+import sys
+import time
+
+from collections import defaultdict
+from contextlib import contextmanager
+from threading import Lock
+
+_MILLISECONDS = 'Milliseconds'
+_COUNT = 'Count'
+
+
+class Recorder:
+    """Collects span durations and counts."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._spans = defaultdict(list)
+        self._counts = defaultdict(int)
+
+    @contextmanager
+    def span(self, name):
+        """
+        Times the body of a with statement, including when it raises.
+
+        :param name: Name of what is being timed e.g. 'dynamodb.batch_get'
+        :type name: :class: `str`
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self._spans[name].append(elapsed)
+
+    def increment(self, name, value=1):
+        """
+        Adds to a count.
+
+        :param name: Name of what is being counted e.g. 'lexical_cache.hits'
+        :type name: :class: `str`
+        :param value: Amount to add
+        :type value: :class: `int`
+        """
+        with self._lock:
+            self._counts[name] += value
+
+    def snapshot(self):
+        """
+        Returns everything recorded so far.
+
+        :return: Durations in milliseconds of each span, and counts, keyed by name
+        :rtype: :class: `dict`
+        """
+        with self._lock:
+            return {
+                'spans': {name: list(durations) for name, durations in self._spans.items()},
+                'counts': dict(self._counts),
+            }
+
+    def reset(self):
+        """Forgets everything recorded so far."""
+        with self._lock:
+            self._spans.clear()
+            self._counts.clear()
+
+
+class InMemorySink:
+    """Keeps published snapshots so that they can be inspected."""
+
+    def __init__(self):
+        self.records = []
+
+    def emit(self, snapshot, dimensions=None):
+        """
+        Keeps a snapshot.
+
+        :param snapshot: Spans and counts as returned by `Recorder.snapshot`
+        :type snapshot: :class: `dict`
+        :param dimensions: Names and values to tag the metrics with e.g. {'FunctionName': 'banana'}
+        :type dimensions: :class: `dict`
+        """
+        self.records.append(dict(snapshot, dimensions=dict(dimensions or {})))
+
+
+class EmfSink:
+    """Writes snapshots as CloudWatch Embedded Metric Format log lines."""
+
+    def __init__(self, namespace, stream=None):
+        """
+        :param namespace: CloudWatch metric namespace
+        :type namespace: :class: `str`
+        :param stream: Where to write, defaults to stdout
+        :type stream: :class: `file`
+        """
+        self._namespace = namespace
+        self._stream = stream
+
+    def emit(self, snapshot, dimensions=None):
+        """
+        Writes a snapshot as a single JSON line. Each span becomes a metric of the milliseconds
+        spent in it plus a '.calls' count of how many times it ran.
+
+        :param snapshot: Spans and counts as returned by `Recorder.snapshot`
+        :type snapshot: :class: `dict`
+        :param dimensions: Names and values to tag the metrics with e.g. {'FunctionName': 'banana'}
+        :type dimensions: :class: `dict`
+        """
+        stream = self._stream or sys.stdout
+        stream.write(json.dumps(self.to_emf(snapshot, dimensions)) + '\n')
+        stream.flush()
+
+    def to_emf(self, snapshot, dimensions=None):
+        """
+        Converts a snapshot to an Embedded Metric Format document.
+
+        :param snapshot: Spans and counts as returned by `Recorder.snapshot`
+        :type snapshot: :class: `dict`
+        :param dimensions: Names and values to tag the metrics with
+        :type dimensions: :class: `dict`
+        :return: EMF document
+        :rtype: :class: `dict`
+        """
+        dimensions = dimensions or {}
+        values = {}
+        metrics = []
+        for name, durations in sorted(snapshot.get('spans').items()):
+            values[name] = round(sum(durations), 3)
+            values[f'{name}.calls'] = len(durations)
+            metrics.append({'Name': name, 'Unit': _MILLISECONDS})
+            metrics.append({'Name': f'{name}.calls', 'Unit': _COUNT})
+        for name, count in sorted(snapshot.get('counts').items()):
+            values[name] = count
+            metrics.append({'Name': name, 'Unit': _COUNT})
+
+        document = {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': self._namespace,
+                    'Dimensions': [list(dimensions)],
+                    'Metrics': metrics,
+                }],
+            },
+        }
+        document.update(dimensions)
+        document.update(values)
+        return document
+
+
+# Module level so that every DAO, on whatever thread, records to the one place.
+recorder = Recorder()
+_sinks = []
+
+
+def span(name):
+    """Times the body of a with statement on the module level recorder, see `Recorder.span`."""
+    return recorder.span(name)
+
+
+def increment(name, value=1):
+    """Adds to a count on the module level recorder, see `Recorder.increment`."""
+    recorder.increment(name, value)
+
+
+def reset():
+    """Forgets everything recorded so far by the module level recorder."""
+    recorder.reset()
+
+
+def add_sink(sink):
+    """
+    Adds somewhere for `publish` to send snapshots.
+
+    :param sink: Object with an emit(snapshot, dimensions) method e.g. `InMemorySink`
+    :type sink: :class: `object`
+    """
+    _sinks.append(sink)
+
+
+def remove_sink(sink):
+    """
+    Stops sending snapshots to a sink.
+
+    :param sink: Sink previously added
+    :type sink: :class: `object`
+    """
+    if sink in _sinks:
+        _sinks.remove(sink)
+
+
+def set_emf_stream(stream):
+    """
+    Makes every `EmfSink` added so far write to somewhere other than stdout.
+
+    :param stream: Where to write e.g. sys.stderr
+    :type stream: :class: `file`
+    """
+    for sink in _sinks:
+        if isinstance(sink, EmfSink):
+            sink._stream = stream  # pylint: disable=protected-access
+
+
+def publish(dimensions=None):
+    """
+    Sends a snapshot of the module level recorder to every sink.
+
+    :param dimensions: Names and values to tag the metrics with e.g. {'FunctionName': 'banana'}
+    :type dimensions: :class: `dict`
+    :return: Spans and counts published
+    :rtype: :class: `dict`
+    """
+    snapshot = recorder.snapshot()
+    for sink in list(_sinks):
+        sink.emit(snapshot, dimensions)
+    return snapshot
+
+
+if os.environ.get('METRICS_NAMESPACE'):
+    add_sink(EmfSink(os.environ['METRICS_NAMESPACE']))
@@ -0,0 +1,212 @@
+"""
+In-process cache of lexical data about words. Lambda containers are re-used between warm invocations
+so anything held at module level survives from one request to the next. Common words e.g. "bananas"
+are then only looked up in DynamoDB once per container rather than once per request.
+
+Words that are known not to be words, e.g. those Oxford couldn't find, are held in an `ExpiringSet`
+instead, which only remembers when each word expires.
+"""
+
+# pylint: disable=invalid-name
+
+import time
+
+from collections import OrderedDict
+from threading import Lock
+
+from bananas_as_a_service.environment import get_int
+
+DEFAULT_MAX_SIZE = 1024
+DEFAULT_TTL = 3600  # Seconds
+
+
+def _normalise(word):
+    return word.strip().lower() if isinstance(word, str) else word
+
+
+class LexicalCache:
+    """
+    Bounded Least Recently Used cache with a Time To Live, mapping words to their classifications.
+
+    Classifications are records that never change, so they are shared with callers rather than
+    copied on the way in and out.
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL):
+        """
+        :param max_size: Maximum number of words held before the least recently used is evicted
+        :type max_size: :class: `int`
+        :param ttl: Seconds before a cached word is considered stale
+        :type ttl: :class: `int`
+        """
+        self._max_size = max_size
+        self._ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    @classmethod
+    def from_environment(cls, prefix='LEXICAL_CACHE'):
+        """
+        Creates a cache sized by the <prefix>_SIZE and <prefix>_TTL environment variables.
+
+        :param prefix: Start of the environment variable names
+        :type prefix: :class: `str`
+        :return: Configured cache
+        :rtype: :class: `LexicalCache`
+        """
+        return cls(
+            max_size=get_int(f'{prefix}_SIZE', DEFAULT_MAX_SIZE),
+            ttl=get_int(f'{prefix}_TTL', DEFAULT_TTL),
+        )
+
+    @property
+    def stats(self):
+        """Returns hit, miss, eviction and expiration counters alongside the current size."""
+        return {
+            'hits': self._hits,
+            'misses': self._misses,
+            'evictions': self._evictions,
+            'expirations': self._expirations,
+            'size': len(self._entries),
+        }
+
+    def get_many(self, words):
+        """
+        Looks up classifications for words, counting a hit or miss for each.
+
+        :param words: Words to look up
+        :type words: :class: `list`
+        :return: Classifications of the words that were cached, keyed by word
+        :rtype: :class: `dict`
+        """
+        found = {}
+        now = time.monotonic()
+        with self._lock:
+            for word in words:
+                key = _normalise(word)
+                entry = self._entries.get(key)
+                if entry and entry[0] < now:
+                    del self._entries[key]
+                    self._expirations += 1
+                    entry = None
+
+                if entry:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    found[word] = entry[1]
+                else:
+                    self._misses += 1
+        return found
+
+    def put_many(self, classifications):
+        """
+        Caches classifications, evicting the least recently used words if over capacity.
+
+        :param classifications: Lexical information about words
+        :type classifications: :class: `list` of :class: `Classification`
+        """
+        if self._max_size <= 0:
+            return
+
+        expires = time.monotonic() + self._ttl
+        with self._lock:
+            for classification in classifications:
+                key = _normalise(classification.word)
+                self._entries[key] = (expires, classification)
+                self._entries.move_to_end(key)
+
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def clear(self):
+        """Empties the cache and resets the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._hits = self._misses = self._evictions = self._expirations = 0
+
+
+class ExpiringSet:
+    """Bounded set of words that each drop out after a Time To Live, oldest first when full."""
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL):
+        """
+        :param max_size: Maximum number of words held before the least recently added is evicted
+        :type max_size: :class: `int`
+        :param ttl: Seconds before a word drops out of the set
+        :type ttl: :class: `int`
+        """
+        self._max_size = max_size
+        self._ttl = ttl
+        self._expiries = OrderedDict()
+        self._lock = Lock()
+
+    @classmethod
+    def from_environment(cls, prefix):
+        """
+        Creates a set sized by the <prefix>_SIZE and <prefix>_TTL environment variables.
+
+        :param prefix: Start of the environment variable names
+        :type prefix: :class: `str`
+        :return: Configured set
+        :rtype: :class: `ExpiringSet`
+        """
+        return cls(
+            max_size=get_int(f'{prefix}_SIZE', DEFAULT_MAX_SIZE),
+            ttl=get_int(f'{prefix}_TTL', DEFAULT_TTL),
+        )
+
+    def __len__(self):
+        return len(self._expiries)
+
+    def contains_many(self, words):
+        """
+        Returns which of the words are in the set, dropping any that have expired.
+
+        :param words: Words to check
+        :type words: :class: `list`
+        :return: Words in the set, as passed
+        :rtype: :class: `set`
+        """
+        found = set()
+        now = time.monotonic()
+        with self._lock:
+            for word in words:
+                key = _normalise(word)
+                expires = self._expiries.get(key)
+                if expires is None:
+                    continue
+                if expires < now:
+                    del self._expiries[key]
+                else:
+                    found.add(word)
+        return found
+
+    def add_many(self, words):
+        """
+        Adds words, or restarts their Time To Live, evicting the oldest if over capacity.
+
+        :param words: Words to add
+        :type words: :class: `list`
+        """
+        if self._max_size <= 0:
+            return
+
+        expires = time.monotonic() + self._ttl
+        with self._lock:
+            for word in words:
+                key = _normalise(word)
+                self._expiries[key] = expires
+                self._expiries.move_to_end(key)
+
+            while len(self._expiries) > self._max_size:
+                self._expiries.popitem(last=False)
+
+    def clear(self):
+        """Empties the set."""
+        with self._lock:
+            self._expiries.clear()
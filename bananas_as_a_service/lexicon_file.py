@@ -0,0 +1,306 @@
+"""
+Compact read-only lexicon file, memory mapped so that a word can be looked up without reading the
+whole file into memory. Pages are only read from disk when touched, and are shared with the page
+cache rather than counted twice, which keeps cold starts quick and RSS low for a big lexicon in a
+small Lambda. Build one with `LexiconBuilder`, or by giving a LexiconSnapshot path a `.lex`
+extension.
+
+Layout, all integers little endian:
+  - header: magic b'BLEX', format version, flags, word count, string count, then the file offsets of
+    the index, string table and records
+  - index: (key string id, record offset) per word, sorted by the key's UTF-8 bytes so it can be
+    binary searched
+  - string table: offsets of each string then the UTF-8 bytes of every string. Categories, feature
+    names and the like repeat across thousands of words so each is only stored once and records
+    refer to it by id
+  - records: one per word, each a packed tree of tagged values e.g. a dict of lists of string ids
+
+A reader refuses a file with a different format version, so the layout can change as long as the
+version is bumped.
+"""
+
+# pylint: disable=invalid-name
+
+import mmap
+import os
+import struct
+
+from contextlib import contextmanager
+from decimal import Decimal
+
+from bananas_as_a_service.error_handler import GeneralError
+
+MAGIC = b'BLEX'
+VERSION = 1
+
+# Magic, version, flags, word count, string count, index offset, strings offset, records offset
+_HEADER = struct.Struct('<4sHHIIIII')
+_INDEX_ENTRY = struct.Struct('<II')  # Key string id, record offset
+_OFFSET = struct.Struct('<I')
+_SPAN = struct.Struct('<II')  # Two adjacent offsets i.e. where a string starts and ends
+_LENGTH = struct.Struct('<H')
+_INTEGER = struct.Struct('<q')
+_FLOAT = struct.Struct('<d')
+_MAX_LENGTH = 0xFFFF
+
+# Tags for each packed value
+_NONE = 0
+_STRING = 1
+_LIST = 2
+_DICT = 3
+_INT = 4
+_TRUE = 5
+_FALSE = 6
+_FLOAT_TAG = 7
+
+
+@contextmanager
+def replace_when_written(path, opener=open, mode='wb', **kwargs):
+    """
+    Opens a file that only replaces path once it has been written in full. It is written alongside
+    and then renamed, so a Lambda being packaged never picks up half a file.
+
+    :param path: Path of the file to write
+    :type path: :class: `str`
+    :param opener: Opens the file e.g. gzip.open
+    :type opener: :class: `function`
+    :param mode: Mode to open the file in
+    :type mode: :class: `str`
+    """
+    partial = f'{path}.partial'
+    try:
+        with opener(partial, mode, **kwargs) as partial_file:
+            yield partial_file
+    except Exception:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    os.replace(partial, path)
+
+
+class LexiconBuilder:
+    """Collects classifications and writes them as a lexicon file."""
+
+    def __init__(self):
+        self._entries = {}
+        self._strings = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, word, value):
+        """
+        Adds, or replaces, the classification of a word.
+
+        :param word: Word, with numbers as words e.g. 'five'
+        :type word: :class: `str`
+        :param value: Classification e.g. {'categories': ['noun'], 'features': [], ...}
+        :type value: :class: `dict`
+        """
+        self._entries[str(word)] = value
+
+    def write(self, path):
+        """
+        Writes the lexicon file, replacing any that is there.
+
+        :param path: Path to write to
+        :type path: :class: `str`
+        :return: Number of words written
+        :rtype: :class: `int`
+        """
+        self._strings = {}
+        records = bytearray()
+        index = []
+        for key in sorted(self._entries, key=lambda word: word.encode('utf-8')):
+            index.append((self._intern(key), len(records)))
+            self._pack(self._entries[key], records)
+
+        strings = [string.encode('utf-8') for string in self._strings]
+        index_offset = _HEADER.size
+        strings_offset = index_offset + _INDEX_ENTRY.size * len(index)
+        string_data_offset = strings_offset + _OFFSET.size * (len(strings) + 1)
+        records_offset = string_data_offset + sum(len(string) for string in strings)
+
+        with replace_when_written(path) as lexicon_file:
+            lexicon_file.write(_HEADER.pack(
+                MAGIC, VERSION, 0, len(index), len(strings),
+                index_offset, strings_offset, records_offset,
+            ))
+            for string_id, record_offset in index:
+                lexicon_file.write(_INDEX_ENTRY.pack(string_id, records_offset + record_offset))
+            offset = string_data_offset
+            for string in strings:
+                lexicon_file.write(_OFFSET.pack(offset))
+                offset += len(string)
+            lexicon_file.write(_OFFSET.pack(offset))
+            for string in strings:
+                lexicon_file.write(string)
+            lexicon_file.write(records)
+        return len(index)
+
+    def _intern(self, string):
+        return self._strings.setdefault(string, len(self._strings))
+
+    def _pack(self, value, out):
+        if value is None:
+            out.append(_NONE)
+        elif isinstance(value, str):
+            out.append(_STRING)
+            out += _OFFSET.pack(self._intern(value))
+        elif isinstance(value, bool):
+            out.append(_TRUE if value else _FALSE)
+        elif isinstance(value, int) or (
+                isinstance(value, Decimal) and value == value.to_integral()):
+            out.append(_INT)
+            out += _INTEGER.pack(int(value))
+        elif isinstance(value, (float, Decimal)):
+            out.append(_FLOAT_TAG)
+            out += _FLOAT.pack(float(value))
+        elif isinstance(value, (list, tuple)):
+            out.append(_LIST)
+            out += _LENGTH.pack(self._check_length(value))
+            for item in value:
+                self._pack(item, out)
+        elif isinstance(value, dict):
+            out.append(_DICT)
+            out += _LENGTH.pack(self._check_length(value))
+            for key, item in value.items():
+                out += _OFFSET.pack(self._intern(str(key)))
+                self._pack(item, out)
+        else:
+            raise GeneralError(f"Unable to store {type(value).__name__} in a lexicon file")
+
+    @classmethod
+    def _check_length(cls, value):
+        if len(value) > _MAX_LENGTH:
+            raise GeneralError(f"Too many items to store in a lexicon file: {len(value)}")
+        return len(value)
+
+
+class LexiconFile:
+    """
+    Memory mapped lexicon file. Lookups binary search the index, so take O(log n) reads of the map,
+    and only the record of the word found is unpacked. Safe to share between threads.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Path to a file written by `LexiconBuilder`
+        :type path: :class: `str`
+        """
+        try:
+            with open(path, 'rb') as lexicon_file:
+                self._map = mmap.mmap(lexicon_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as err:
+            raise GeneralError(f"Unable to open lexicon file {path}: {err}")
+
+        if len(self._map) < _HEADER.size:
+            raise GeneralError(f"Not a lexicon file: {path}")
+        (magic, version, _, self._count, _, self._index_offset, self._strings_offset,
+         records_offset) = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise GeneralError(f"Not a lexicon file: {path}")
+        if version != VERSION:
+            raise GeneralError(
+                f"Unsupported lexicon file version {version} in {path}, expected {VERSION}")
+        if not (self._index_offset + _INDEX_ENTRY.size * self._count <= self._strings_offset
+                <= records_offset <= len(self._map)):
+            raise GeneralError(f"Truncated lexicon file: {path}")
+
+    @classmethod
+    def is_lexicon_file(cls, path):
+        """
+        Returns whether a file starts with the lexicon file magic bytes.
+
+        :param path: Path to the file
+        :type path: :class: `str`
+        :rtype: :class: `bool`
+        """
+        with open(path, 'rb') as candidate:
+            return candidate.read(len(MAGIC)) == MAGIC
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, word):
+        return self._find(word) is not None
+
+    def get(self, word, default=None):
+        """
+        Looks up the classification of a word.
+
+        :param word: Word, with numbers as words e.g. 'five'
+        :type word: :class: `str`
+        :param default: Returned if the word isn't there
+        :type default: :class: `object`
+        :return: Classification of the word
+        :rtype: :class: `dict`
+        """
+        record_offset = self._find(word)
+        if record_offset is None:
+            return default
+        value, _ = self._unpack(record_offset)
+        return value
+
+    def close(self):
+        """Unmaps the file."""
+        self._map.close()
+
+    def _find(self, word):
+        if not isinstance(word, str):
+            return None
+
+        key = word.encode('utf-8')
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            string_id, record_offset = _INDEX_ENTRY.unpack_from(
+                self._map, self._index_offset + middle * _INDEX_ENTRY.size)
+            candidate = self._string_bytes(string_id)
+            if candidate == key:
+                return record_offset
+            if candidate < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def _string_bytes(self, string_id):
+        start, end = _SPAN.unpack_from(self._map, self._strings_offset + string_id * _OFFSET.size)
+        return self._map[start:end]
+
+    def _string(self, offset):
+        string_id, = _OFFSET.unpack_from(self._map, offset)
+        return self._string_bytes(string_id).decode('utf-8')
+
+    def _unpack(self, offset):
+        # Returns the value at offset and the offset just past it.
+        tag = self._map[offset]
+        offset += 1
+        if tag == _STRING:
+            return self._string(offset), offset + _OFFSET.size
+        if tag == _LIST:
+            length, = _LENGTH.unpack_from(self._map, offset)
+            offset += _LENGTH.size
+            items = []
+            for _ in range(length):
+                item, offset = self._unpack(offset)
+                items.append(item)
+            return items, offset
+        if tag == _DICT:
+            length, = _LENGTH.unpack_from(self._map, offset)
+            offset += _LENGTH.size
+            items = {}
+            for _ in range(length):
+                key = self._string(offset)
+                items[key], offset = self._unpack(offset + _OFFSET.size)
+            return items, offset
+        if tag == _INT:
+            return _INTEGER.unpack_from(self._map, offset)[0], offset + _INTEGER.size
+        if tag == _FLOAT_TAG:
+            return _FLOAT.unpack_from(self._map, offset)[0], offset + _FLOAT.size
+        if tag in (_TRUE, _FALSE):
+            return tag == _TRUE, offset
+        if tag == _NONE:
+            return None, offset
+        raise GeneralError(f"Corrupt lexicon file, unknown tag {tag} at offset {offset - 1}")
@@ -0,0 +1,154 @@
+"""
+Read-only snapshot of classifications, built offline by `python -m cli_tools.bulk_import` and loaded
+once at cold start. It is the first place WordClassifier looks, so common words never leave the
+container. The snapshot is gzipped JSON of classifications keyed the same way as DynamoDB i.e.
+numbers as words e.g. {"bananas": {"categories": ["noun"], ...}, "five": {...}}.
+
+A path ending `.lex` is instead a memory mapped LexiconFile, which is looked up in place rather than
+read into memory up front. Prefer it for a big lexicon.
+
+It is looked for at LEXICON_SNAPSHOT, or `lexicon.lex` then `lexicon.json.gz` alongside this module
+so that one copied into the package is deployed with it. No snapshot is fine, every word then just
+misses, and so is one that can't be loaded as it is loaded at import time. It is logged and left out
+rather than failing every invocation.
+"""
+
+# pylint: disable=invalid-name, logging-fstring-interpolation
+
+import gzip
+import json
+import os
+
+from bananas_as_a_service.app_logger import Logger
+from bananas_as_a_service.classification import Classification
+from bananas_as_a_service.error_handler import GeneralError
+from bananas_as_a_service.lexicon_file import LexiconBuilder, LexiconFile, replace_when_written
+from bananas_as_a_service.number_words import to_words
+
+logger = Logger.get_logger()
+
+LEXICON_FILE_EXTENSION = '.lex'
+DEFAULT_PATHS = [
+    os.path.join(os.path.dirname(__file__), 'lexicon.lex'),
+    os.path.join(os.path.dirname(__file__), 'lexicon.json.gz'),
+]
+
+
+class LexiconSnapshot:
+    """
+    Classifications that are loaded once and never change. They are kept in their stored form and
+    only made into `Classification` records when looked up.
+    """
+
+    def __init__(self, entries=None):
+        """
+        :param entries: Classifications keyed by word, with numbers as words
+        :type entries: :class: `dict` or `LexiconFile`
+        """
+        self._entries = entries or {}
+
+    @classmethod
+    def from_environment(cls):
+        """
+        Loads the snapshot at LEXICON_SNAPSHOT, or the first default path, if there is one.
+
+        :return: Loaded snapshot, empty if there is no file or it can't be loaded
+        :rtype: :class: `LexiconSnapshot`
+        """
+        if 'LEXICON_SNAPSHOT' in os.environ:
+            path = os.environ['LEXICON_SNAPSHOT']
+            if not os.path.exists(path):
+                logger.warning(f"Lexicon snapshot not found: {path}")
+                return cls()
+            return cls._load_or_empty(path)
+
+        for path in DEFAULT_PATHS:
+            if os.path.exists(path):
+                return cls._load_or_empty(path)
+        return cls()
+
+    @classmethod
+    def _load_or_empty(cls, path):
+        try:
+            return cls.load(path)
+        except (GeneralError, OSError) as err:
+            logger.error(f"Carrying on without the lexicon snapshot: {err}")
+            return cls()
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads a snapshot file, or maps it if it is a lexicon file.
+
+        :param path: Path to gzipped JSON snapshot or lexicon file
+        :type path: :class: `str`
+        :return: Loaded snapshot
+        :rtype: :class: `LexiconSnapshot`
+        """
+        if LexiconFile.is_lexicon_file(path):
+            entries = LexiconFile(path)
+            logger.info(f"Mapped lexicon file of {len(entries)} word(s) from: {path}")
+            return cls(entries)
+
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as snapshot_file:
+                entries = json.load(snapshot_file)
+        except (OSError, ValueError) as err:
+            raise GeneralError(f"Unable to load lexicon snapshot {path}: {err}")
+
+        logger.info(f"Loaded lexicon snapshot of {len(entries)} word(s) from: {path}")
+        return cls(entries)
+
+    @classmethod
+    def write(cls, path, classifications):
+        """
+        Writes classifications to a snapshot file, replacing any that is there. Paths ending `.lex`
+        are written as a lexicon file.
+
+        :param path: Path to gzipped JSON snapshot or lexicon file
+        :type path: :class: `str`
+        :param classifications: Lexical information about words
+        :type classifications: :class: `list` of :class: `Classification`
+        :return: Number of words written
+        :rtype: :class: `int`
+        """
+        entries = {
+            cls._key(classification.word): classification.to_dict()
+            for classification in classifications
+        }
+
+        if path.endswith(LEXICON_FILE_EXTENSION):
+            builder = LexiconBuilder()
+            for word, value in entries.items():
+                builder.add(word, value)
+            return builder.write(path)
+
+        with replace_when_written(path, gzip.open, 'wt', encoding='utf-8') as snapshot_file:
+            json.dump(entries, snapshot_file, sort_keys=True, separators=(',', ':'), default=str)
+        return len(entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_many(self, words):
+        """
+        Looks up classifications for words.
+
+        :param words: Words to look up
+        :type words: :class: `list`
+        :return: Classifications of the words in the snapshot, keyed by word
+        :rtype: :class: `dict`
+        """
+        if not self._entries:
+            return {}
+
+        found = {}
+        for word in words:
+            value = self._entries.get(self._key(word))
+            if value is not None:
+                found[word] = Classification.from_dict(word, value)
+        return found
+
+    @classmethod
+    def _key(cls, word):
+        return to_words(word) if isinstance(word, int) else word
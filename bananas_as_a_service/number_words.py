@@ -0,0 +1,89 @@
+"""
+Converting between numbers and number words e.g. 5 and 'five'. Banana, the DynamoDAO and sentence
+capitalisation all do this for every word so 0 to 999 are looked up in a table instead. The table is
+built on first use, or by `precompute` e.g. while pre-warming, and then kept for warm invocations.
+
+Most words aren't numbers at all. Rather than asking word2number and catching the ValueError it
+raises, words with nothing in them that word2number understands are turned away up front.
+"""
+
+# pylint: disable=invalid-name, global-statement
+
+from num2words import num2words
+from word2number import w2n
+
+PRECOMPUTED = 1000  # 0 to 999
+
+# Every word that word2number knows e.g. 'five', 'hundred'; it can't convert a word without one.
+_VOCABULARY = frozenset(w2n.american_number_system)
+
+_to_words = {}
+_to_numbers = {}
+
+
+def precompute():
+    """Builds the lookup tables for 0 to 999 if they haven't been already."""
+    global _to_words, _to_numbers
+
+    if _to_words:
+        return
+
+    words_by_number = {}
+    numbers_by_words = {}
+    for number in range(PRECOMPUTED):
+        words = num2words(number)
+        words_by_number[number] = words
+        numbers_by_words[words] = number
+    # Assign whole tables at once so other threads never see one half built.
+    _to_numbers = numbers_by_words
+    _to_words = words_by_number
+
+
+def to_words(number):
+    """
+    Converts a number to words e.g. 5 to 'five'.
+
+    :param number: Number to convert
+    :type number: :class: `int`
+    :return: Number as words
+    :rtype: :class: `str`
+    """
+    precompute()
+    words = _to_words.get(number)
+    return words if words is not None else num2words(number)
+
+
+def to_number(token):
+    """
+    Converts a number word or string of digits to a number e.g. 'five' or '5' to 5.
+
+    :param token: Word to convert
+    :type token: :class: `str`
+    :return: Number, or None if the word isn't one
+    :rtype: :class: `int` or `NoneType`
+    """
+    if not isinstance(token, str):
+        return None
+
+    if token.isdigit():
+        try:
+            return int(token)
+        except ValueError:
+            return None  # Digit-like characters such as superscripts
+
+    precompute()
+    number = _to_numbers.get(token.lower())
+    if number is not None:
+        return number
+
+    if token.isalnum():
+        # A single word, the usual case, so skip splitting it up.
+        if token.lower() not in _VOCABULARY:
+            return None
+    elif not any(word in _VOCABULARY for word in token.replace('-', ' ').lower().split()):
+        return None
+
+    try:
+        return w2n.word_to_num(token)
+    except ValueError:
+        return None
@@ -1,49 +1,233 @@
 """
-API for accessing lexical data about words. Currently, first accesses the DynamoDAO and falls back
-to the OxfordDAO for missing word. Future implementation will have ElastiCache before DynamoDB.
+API for accessing lexical data about words. First checks the read-only LexiconSnapshot loaded at
+cold start, then the in-process LexicalCache, then the RedisDAO (ElastiCache, when configured), then
+accesses the DynamoDAO and falls back to the OxfordDAO for missing word.
+
+In async mode (CLASSIFIER_MODE=async) the DynamoDB lookups, Oxford fallbacks and DynamoDB writes run
+as coroutines on one event loop rather than in strict phases, so a word missing from DynamoDB goes
+to Oxford as soon as its batch comes back. The DAOs are blocking so each call is handed to a bounded
+thread pool, with a semaphore capping how many are in flight.
+
+Where each word was found, or not, is counted with `bananas_as_a_service.instrumentation`.
 """
 
-# pylint: disable=too-few-public-methods, logging-fstring-interpolation
+# pylint: disable=invalid-name, too-few-public-methods, logging-fstring-interpolation
+# pylint: disable=import-outside-toplevel
+
+import asyncio
+import os
 
+from concurrent.futures import ThreadPoolExecutor
+
+from bananas_as_a_service import instrumentation
 from bananas_as_a_service.data_access_layer.dynamo_dao import DynamoDAO
-from bananas_as_a_service.data_access_layer.oxford_dao import OxfordDAO
+from bananas_as_a_service.data_access_layer.redis_dao import RedisDAO
 from bananas_as_a_service.app_logger import Logger
+from bananas_as_a_service.environment import get_int
+from bananas_as_a_service.lexical_cache import ExpiringSet, LexicalCache
+from bananas_as_a_service.lexicon_snapshot import LexiconSnapshot
+
+ASYNC_MODE = 'async'
+DEFAULT_CONCURRENCY = 8
+DEFAULT_ASYNC_BATCH_SIZE = 25  # Smaller than a full BatchGetItem so batches overlap with Oxford
+
+# Module level so that warm Lambda invocations in the same container share them.
+lexical_cache = LexicalCache.from_environment()
+lexicon_snapshot = LexiconSnapshot.from_environment()
+blacklist_cache = ExpiringSet.from_environment('BLACKLIST_CACHE')
 
 
 class WordClassifier:
     """API to hide implementation of where lexical data about words comes from."""
 
-    def __init__(self, words):
+    def __init__(self, words, cache_client=None, mode=None):
         """
         :param words: Words to be classified
         :type words: :class: `list`
+        :param cache_client: Redis protocol client, defaults to one created from the environment
+        :type cache_client: :class: `redis.Redis`
+        :param mode: 'async' for the asyncio pipeline, defaults to CLASSIFIER_MODE environment var
+        :type mode: :class: `str`
         """
         self._logger = Logger().get_logger()
-        self._dynamo_dao = DynamoDAO(words)
-        self._oxford_dao = OxfordDAO()
+        self._words = words
+        self._mode = mode if mode is not None else os.environ.get('CLASSIFIER_MODE')
+        self._from_snapshot = lexicon_snapshot.get_many(words)
+        remaining = [word for word in words if word not in self._from_snapshot]
+        self._cached = lexical_cache.get_many(remaining)
+        remaining = [word for word in remaining if word not in self._cached]
+        self._redis_dao = RedisDAO(cache_client)
+        self._remote_cached = self._redis_dao.check_cache(remaining)
+        self._dynamo_dao = DynamoDAO(
+            [word for word in remaining if word not in self._remote_cached])
+        self._oxford = None
         self._classified = []
 
+    @property
+    def _oxford_dao(self):
+        # Requests, dpath and the Oxford credentials are only needed on a DynamoDB miss.
+        if self._oxford is None:
+            from bananas_as_a_service.data_access_layer.oxford_dao import OxfordDAO
+            self._oxford = OxfordDAO()
+        return self._oxford
+
     def classify(self):
         """
         Returns lexical data about passed words.
 
-        First attempts to find data per word in DynamoDB; if that fails those words are queried via
-        the Oxford Dictionaries API directly.
+        First attempts to find data per word in the snapshot, then the in-process cache, then the
+        remote cache, then in DynamoDB; if that fails those words are queried via the Oxford
+        Dictionaries API directly.
 
         :return: Lexical information about words
-        :rtype: :class: `list`
+        :rtype: :class: `list` of :class: `Classification`
         """
+        if self._mode == ASYNC_MODE:
+            loop = asyncio.new_event_loop()
+            try:
+                return loop.run_until_complete(self.classify_async())
+            finally:
+                loop.close()
+
         self._logger.info("Looking up lexical data")
+        self._add_cached()
 
         self._dynamo_dao.check_storage()
 
         if self._dynamo_dao.found:
             self._classified.extend(self._dynamo_dao.found)
+            lexical_cache.put_many(self._dynamo_dao.found)
+            self._redis_dao.update_cache(self._dynamo_dao.found)
             self._logger.info(f"Word(s) found in DynamoDB: {len(self._dynamo_dao.found)}")
+        self._count_dynamo_lookups()
         if self._dynamo_dao.not_found:
-            oxford_classifications = self._oxford_dao.classify(self._dynamo_dao.not_found)
-            self._classified.extend(oxford_classifications)
-            self._dynamo_dao.update_storage(oxford_classifications)
             self._logger.info(f"Word(s) not found in DynamoDB: {len(self._dynamo_dao.not_found)}")
+            to_request = self._remove_blacklisted(self._dynamo_dao.not_found)
+            if to_request:
+                oxford_classifications = self._oxford_dao.classify(to_request)
+                self._classified.extend(oxford_classifications)
+                lexical_cache.put_many(oxford_classifications)
+                self._redis_dao.update_cache(oxford_classifications)
+                self._dynamo_dao.update_storage(oxford_classifications)
+                self._update_blacklist(self._oxford_dao.not_found)
+                instrumentation.increment('oxford.found', len(oxford_classifications))
+
+        self._logger.info(f"Lexical cache stats: {lexical_cache.stats}")
 
         return self._classified
+
+    async def classify_async(self):
+        """
+        Returns lexical data about passed words, overlapping the DynamoDB and Oxford lookups.
+
+        Words are looked up in DynamoDB in batches of CLASSIFIER_BATCH_SIZE. As each batch returns,
+        its missing words are requested from Oxford straight away and saved back to DynamoDB while
+        other batches are still in flight. At most CLASSIFIER_CONCURRENCY calls run at once.
+
+        :return: Lexical information about words, in the order they were passed
+        :rtype: :class: `list` of :class: `Classification`
+        """
+        self._logger.info("Looking up lexical data asynchronously")
+        self._add_cached()
+
+        concurrency = get_int('CLASSIFIER_CONCURRENCY', DEFAULT_CONCURRENCY)
+        batch_size = get_int('CLASSIFIER_BATCH_SIZE', DEFAULT_ASYNC_BATCH_SIZE)
+        loop = asyncio.get_event_loop()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            async def run(func, *args):
+                async with semaphore:
+                    return await loop.run_in_executor(executor, func, *args)
+
+            async def from_oxford(oxford_dao, word):
+                classification = await run(oxford_dao.classify_token, word)
+                if classification:
+                    self._classified.append(classification)
+                return classification
+
+            async def from_dynamo(batch):
+                found, not_found = await run(self._dynamo_dao.lookup, batch)
+                if found:
+                    self._classified.extend(found)
+                    lexical_cache.put_many(found)
+                    await run(self._redis_dao.update_cache, found)
+                if not_found:
+                    to_request = await run(self._remove_blacklisted, not_found)
+                    oxford_dao = self._oxford_dao if to_request else None
+                    classifications = await asyncio.gather(
+                        *[from_oxford(oxford_dao, word) for word in to_request])
+                    classifications = [item for item in classifications if item]
+                    instrumentation.increment('oxford.found', len(classifications))
+                    if classifications:
+                        lexical_cache.put_many(classifications)
+                        self._dynamo_dao.update_storage(classifications)  # Already in background
+                        await run(self._redis_dao.update_cache, classifications)
+
+            words = self._dynamo_dao.words
+            await asyncio.gather(*[
+                from_dynamo(words[start:start + batch_size])
+                for start in range(0, len(words), batch_size)
+            ])
+
+        if self._oxford is not None:
+            self._update_blacklist(self._oxford.not_found)
+        self._count_dynamo_lookups()
+        self._logger.info(f"Word(s) found in DynamoDB: {len(self._dynamo_dao.found)}")
+        self._logger.info(f"Word(s) not found in DynamoDB: {len(self._dynamo_dao.not_found)}")
+        self._logger.info(f"Lexical cache stats: {lexical_cache.stats}")
+
+        # Completion order is arbitrary so put things back in the order they were asked for.
+        order = {word: index for index, word in enumerate(self._words)}
+        self._classified.sort(key=lambda item: order.get(item.word, len(order)))
+        return self._classified
+
+    def _add_cached(self):
+        instrumentation.increment('snapshot.hits', len(self._from_snapshot))
+        instrumentation.increment('lexical_cache.hits', len(self._cached))
+        instrumentation.increment('redis.hits', len(self._remote_cached))
+        if self._from_snapshot:
+            self._classified.extend(self._from_snapshot.values())
+            self._logger.info(f"Word(s) found in lexicon snapshot: {len(self._from_snapshot)}")
+        if self._cached:
+            self._classified.extend(self._cached.values())
+            self._logger.info(f"Word(s) found in lexical cache: {len(self._cached)}")
+        if self._remote_cached:
+            remote_cached = list(self._remote_cached.values())
+            self._classified.extend(remote_cached)
+            lexical_cache.put_many(remote_cached)
+
+    def _remove_blacklisted(self, words):
+        # Words that Oxford has recently failed to find aren't worth another second-long request.
+        blacklisted = blacklist_cache.contains_many(words)
+        remote_blacklisted = self._dynamo_dao.check_blacklist(
+            [word for word in words if word not in blacklisted])
+        blacklist_cache.add_many(remote_blacklisted)
+        blacklisted.update(remote_blacklisted)
+
+        instrumentation.increment('blacklist.hits', len(blacklisted))
+        if blacklisted:
+            self._logger.info(f"Skipping blacklisted word(s): {len(blacklisted)}")
+        return [word for word in words if word not in blacklisted]
+
+    def _count_dynamo_lookups(self):
+        instrumentation.increment('dynamodb.found', len(self._dynamo_dao.found))
+        instrumentation.increment('dynamodb.not_found', len(self._dynamo_dao.not_found))
+
+    def _update_blacklist(self, words):
+        instrumentation.increment('oxford.not_found', len(words))
+        if words:
+            blacklist_cache.add_many(words)
+            self._dynamo_dao.update_blacklist(words)
+
+    def flush(self):
+        """
+        Waits for newly classified words to finish being saved to DynamoDB.
+
+        :return: Items written, retried and failed per batch
+        :rtype: :class: `list`
+        """
+        write_metrics = self._dynamo_dao.flush()
+        if write_metrics:
+            self._logger.info(f"DynamoDB write metrics: {write_metrics}")
+        return write_metrics
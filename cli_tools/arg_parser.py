@@ -17,7 +17,12 @@ def parse_args():
         )
     )
     parser.add_argument(
-        '-b', '--bananas', required=True, help='YAML file containing phrases to "machine learn"'
+        '-b', '--bananas', required=True,
+        help='YAML file containing phrases to "machine learn", or phrases keyed by friend\'s name'
     )
     parser.add_argument('-p', '--performance', required=False, help='Log performance metrics')
+    parser.add_argument(
+        '-n', '--ndjson', action='store_true',
+        help='Stream sentences to stdout as newline delimited JSON, one at a time'
+    )
     return parser.parse_args()
@@ -0,0 +1,176 @@
+"""
+Offline bulk import of classifications, so that common words are already known before anyone asks
+for them. Takes a word list (one or more words per line) or a YAML phrase corpus like the one passed
+to go_bananas.py, tokenises it the same way Banana does, and then in chunks:
+  - looks the words up in DynamoDB, 100 per BatchGetItem
+  - classifies the missing ones with the Oxford API, at most --concurrency requests at once and
+    still within OXFORD_REQUESTS_PER_MINUTE. There is a pooled connection for each of the
+    OXFORD_MAX_WORKERS, so --concurrency can't be more than that; raise both together
+  - writes them back to DynamoDB 25 per BatchWriteItem, and words Oxford doesn't know to the
+    blacklist
+
+Everything found or classified can also be exported as a LexiconSnapshot, which the Lambda loads at
+cold start and checks before anything else e.g.:
+
+    python -m cli_tools.bulk_import --words words.txt --output bananas_as_a_service/lexicon.json.gz
+
+Give the output a `.lex` extension to write a memory mapped LexiconFile instead, which is better for
+tens of thousands of words as it isn't read into memory at cold start.
+
+Needs the same environment as the Lambda e.g. TABLE_NAME, PARTITION_KEY and AWS credentials.
+"""
+
+# pylint: disable=invalid-name, logging-fstring-interpolation, broad-except
+
+import argparse
+import sys
+
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+
+from bananas_as_a_service.banana import Banana
+from bananas_as_a_service.data_access_layer import oxford_dao
+from bananas_as_a_service.data_access_layer.dynamo_dao import DynamoDAO
+from bananas_as_a_service.data_access_layer.oxford_dao import OxfordDAO
+from bananas_as_a_service.lexicon_snapshot import LexiconSnapshot
+from cli_tools.cli_logger import get_logger
+from cli_tools.yaml_loader import load_yaml_file
+
+logger = get_logger()
+
+GENERAL_ERROR = 42
+DEFAULT_CHUNK_SIZE = 500
+
+
+def parse_args():
+    """
+    Defines and parses command line arguments.
+
+    :return: Parsed arguments
+    :rtype: :class: `argparse.Namespace`
+    """
+    parser = argparse.ArgumentParser(
+        description='Classify a corpus of words in bulk into DynamoDB and a lexicon snapshot.')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('-w', '--words', help='Text file of words, one or more per line')
+    source.add_argument('-b', '--bananas', help='YAML file of phrases, or phrases keyed by name')
+    parser.add_argument(
+        '-c', '--concurrency', type=int, default=oxford_dao.max_workers,
+        help='Oxford API requests in flight at once, at most OXFORD_MAX_WORKERS'
+    )
+    parser.add_argument(
+        '-k', '--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+        help='Words looked up, classified and written before moving on to the next'
+    )
+    parser.add_argument(
+        '-o', '--output',
+        help='Write a lexicon snapshot to this path, memory mapped if it ends .lex'
+    )
+    parser.add_argument(
+        '-r', '--reclassify', action='store_true',
+        help="Ask Oxford about every word, even those already in DynamoDB"
+    )
+    parser.add_argument(
+        '-n', '--no-write', action='store_true', help="Don't write anything to DynamoDB"
+    )
+    args = parser.parse_args()
+    if not 0 < args.concurrency <= oxford_dao.max_workers:
+        # Requests beyond the pool size would each open a connection only to throw it away.
+        parser.error(f"--concurrency must be between 1 and {oxford_dao.max_workers}, the "
+                     f"OXFORD_MAX_WORKERS connections pooled for the Oxford API")
+    return args
+
+
+def load_words(words_file=None, bananas_file=None):
+    """
+    Reads and tokenises a word list or YAML phrase corpus.
+
+    :param words_file: Path to text file of words
+    :type words_file: :class: `str`
+    :param bananas_file: Path to YAML file of phrases
+    :type bananas_file: :class: `str`
+    :return: Unique words, with numbers as ints, in the order first seen
+    :rtype: :class: `list`
+    """
+    if words_file:
+        with open(words_file) as text_file:
+            phrases = text_file.read().splitlines()
+    else:
+        phrases = load_yaml_file(bananas_file) or []
+        if isinstance(phrases, dict):
+            phrases = list(chain.from_iterable(phrases.values()))
+    return Banana.words(phrases)
+
+
+def bulk_import(words, concurrency, chunk_size=DEFAULT_CHUNK_SIZE, reclassify=False, write=True):
+    """
+    Classifies words, saving new ones to DynamoDB.
+
+    :param words: Words to classify
+    :type words: :class: `list`
+    :param concurrency: Oxford API requests in flight at once, no more than oxford_dao.max_workers
+    :type concurrency: :class: `int`
+    :param chunk_size: Words to finish with before moving on to the next
+    :type chunk_size: :class: `int`
+    :param reclassify: Whether to skip looking up DynamoDB first
+    :type reclassify: :class: `bool`
+    :param write: Whether to write to DynamoDB
+    :type write: :class: `bool`
+    :return: Lexical information about every word found or classified
+    :rtype: :class: `list` of :class: `Classification`
+    """
+    oxford = None
+    classifications = []
+    for start in range(0, len(words), chunk_size):
+        chunk = words[start:start + chunk_size]
+        dynamo_dao = DynamoDAO(chunk)
+        if reclassify:
+            to_classify = chunk
+        else:
+            found, to_classify = dynamo_dao.lookup(chunk)
+            classifications.extend(found)
+
+        if to_classify:
+            # Only needs the Oxford credentials if there is something to ask it about.
+            oxford = oxford or OxfordDAO()
+            already_not_found = len(oxford.not_found)
+            workers = min(concurrency, oxford_dao.max_workers)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                classified = [
+                    classification for classification in
+                    executor.map(oxford.classify_token, to_classify) if classification
+                ]
+            classifications.extend(classified)
+            if write:
+                dynamo_dao.update_storage(classified)
+                dynamo_dao.update_blacklist(oxford.not_found[already_not_found:])
+                dynamo_dao.flush()
+
+        logger.info(
+            f"Imported {min(start + chunk_size, len(words))} of {len(words)} word(s), "
+            f"{len(to_classify)} from Oxford"
+        )
+    return classifications
+
+
+def main():
+    """Command line entry point."""
+    args = parse_args()
+
+    try:
+        words = load_words(args.words, args.bananas)
+        logger.info(f"Bulk importing {len(words)} unique word(s)")
+        classifications = bulk_import(
+            words, args.concurrency, args.chunk_size, args.reclassify, not args.no_write)
+        if args.output:
+            count = LexiconSnapshot.write(args.output, classifications)
+            logger.info(f"Wrote lexicon snapshot of {count} word(s) to: {args.output}")
+    except Exception as exc:
+        logger.exception(f"Exception in bulk import: {exc}")
+        sys.exit(GENERAL_ERROR)
+    else:
+        logger.info(f"Classified {len(classifications)} of {len(words)} word(s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""
+Measuring how long it takes to import the Lambda entry point, i.e. the cold start tax paid before
+the handler runs. Each run is a fresh interpreter using `python -X importtime`, which is broken down
+per top level package. Pass a budget and the exit code is non-zero when the median is over it, so CI
+can fail the build e.g.:
+
+    python -m cli_tools.import_profiler --budget-ms 500 --output import_time.json
+
+`-X importtime` needs Python 3.7+. Older interpreters, like the Python 3.6 the Lambda and CodeBuild
+run, instead time each module's execution with an import hook and report it in the same format. It
+leaves out the time spent finding modules, so is a little lower than what `-X importtime` reports.
+"""
+
+# pylint: disable=invalid-name, logging-fstring-interpolation
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+from collections import defaultdict
+
+from cli_tools.cli_logger import get_logger
+
+logger = get_logger()
+
+DEFAULT_MODULE = 'bananas_as_a_service.app'
+DEFAULT_RUNS = 5
+OVER_BUDGET = 1
+_TOTAL_MARKER = 'total import time:'
+_IMPORTTIME_MARKER = 'import time:'
+
+# Run before the import being measured, on interpreters without `-X importtime`. Wraps the loader of
+# every module found so that executing it is timed, less the time spent importing other modules.
+_IMPORT_HOOK = '''
+import sys, time
+class _TimedLoader:
+    stack = []
+    def __init__(self, loader, name):
+        self._loader, self._name = loader, name
+    def __getattr__(self, attr):
+        return getattr(self._loader, attr)
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+    def exec_module(self, module):
+        start = time.perf_counter()
+        self.stack.append(0)
+        try:
+            self._loader.exec_module(module)
+        finally:
+            elapsed = time.perf_counter() - start
+            children = self.stack.pop()
+            if self.stack:
+                self.stack[-1] += elapsed
+            sys.stderr.write("%s %d | %d | %s\\n" % (
+                "{marker}", (elapsed - children) * 1e6, elapsed * 1e6, self._name))
+class _TimedFinder:
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+                    spec.loader = _TimedLoader(spec.loader, name)
+                return spec
+        return None
+sys.meta_path.insert(0, _TimedFinder())
+'''.format(marker=_IMPORTTIME_MARKER)
+
+
+def parse_args():
+    """
+    Defines and parses command line arguments.
+
+    :return: Parsed arguments
+    :rtype: :class: `argparse.Namespace`
+    """
+    parser = argparse.ArgumentParser(description='Report the cold start import time of a module.')
+    parser.add_argument('-m', '--module', default=DEFAULT_MODULE, help='Module to import')
+    parser.add_argument(
+        '-r', '--runs', type=int, default=DEFAULT_RUNS, help='Fresh interpreters to measure')
+    parser.add_argument('-b', '--budget-ms', type=float, help='Fail if the median is over this')
+    parser.add_argument('-o', '--output', help='Write the report to this JSON file')
+    return parser.parse_args()
+
+
+def measure_once(module):
+    """
+    Imports a module in a fresh interpreter.
+
+    :param module: Dotted module name
+    :type module: :class: `str`
+    :return: Total milliseconds and milliseconds spent per top level package
+    :rtype: :class: `tuple`
+    """
+    code = (
+        'import time; start = time.perf_counter(); '
+        f'import {module}; '
+        f'print("{_TOTAL_MARKER}", (time.perf_counter() - start) * 1000)'
+    )
+    if _has_importtime():
+        command = [sys.executable, '-X', 'importtime', '-c', code]
+    else:
+        command = [sys.executable, '-c', f'{_IMPORT_HOOK}\n{code}']
+    result = subprocess.run(
+        command,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True,
+    )
+
+    total = float(result.stdout.split(_TOTAL_MARKER)[-1])
+    packages = defaultdict(float)
+    for line in result.stderr.splitlines():
+        # e.g. "import time:       210 |     154465 |           boto3"
+        if not line.startswith(_IMPORTTIME_MARKER) or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len(_IMPORTTIME_MARKER):].split('|')
+        packages[name.strip().split('.')[0]] += int(self_us) / 1000
+    return total, packages
+
+
+def _has_importtime():
+    return sys.version_info >= (3, 7)
+
+
+def profile(module, runs):
+    """
+    Measures a module's import time over several runs.
+
+    :param module: Dotted module name
+    :type module: :class: `str`
+    :param runs: Number of fresh interpreters to measure
+    :type runs: :class: `int`
+    :return: Median total and median per package in milliseconds, heaviest package first
+    :rtype: :class: `dict`
+    """
+    totals = []
+    per_package = defaultdict(list)
+    for _ in range(runs):
+        total, packages = measure_once(module)
+        totals.append(total)
+        for name, elapsed in packages.items():
+            per_package[name].append(elapsed)
+
+    medians = {name: statistics.median(times) for name, times in per_package.items()}
+    return {
+        'module': module,
+        'python': sys.version.split()[0],
+        'runs': runs,
+        'total_ms': round(statistics.median(totals), 1),
+        'packages_ms': {
+            name: round(elapsed, 1)
+            for name, elapsed in sorted(medians.items(), key=lambda item: item[1], reverse=True)
+        },
+    }
+
+
+def main():
+    """Command line entry point."""
+    args = parse_args()
+    report = profile(args.module, args.runs)
+    report['budget_ms'] = args.budget_ms
+
+    logger.info(f"Import of {report.get('module')} took {report.get('total_ms')}ms (median)")
+    for name, elapsed in report.get('packages_ms').items():
+        logger.info(f"{elapsed:>10.1f}ms  {name}")
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+        logger.info(f"Report written to: {args.output}")
+
+    if args.budget_ms is not None:
+        if report.get('total_ms') > args.budget_ms:
+            logger.error(f"Import time over budget of {args.budget_ms}ms")
+            sys.exit(OVER_BUDGET)
+        logger.info(f"Import time within budget of {args.budget_ms}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -24,7 +24,7 @@ def load_yaml_file(input_file):
 
     try:
         with open(input_file) as yaml_file:
-            data = yaml.load(yaml_file)
+            data = yaml.safe_load(yaml_file)
             if not data:
                 raise RuntimeError()
     except RuntimeError:
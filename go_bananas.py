@@ -5,8 +5,11 @@
 # pylint: disable=invalid-name, broad-except, logging-fstring-interpolation
 
 import json
+import sys
 
+from bananas_as_a_service import instrumentation
 from bananas_as_a_service.app import lambda_handler
+from bananas_as_a_service.banana import Banana
 from cli_tools.arg_parser import parse_args
 from cli_tools.cli_logger import get_logger
 from cli_tools.yaml_loader import load_yaml_file
@@ -17,7 +20,7 @@ GENERAL_ERROR = 42
 HTTP_OK = 200
 
 
-def handler(event, context):
+def handler(event, context, ndjson=False):
     """
     Command line runner for bananas_as_a_service.app.lambda_handler
 
@@ -25,23 +28,77 @@ def handler(event, context):
     :type event: :class: `dict`
     :param context: Runtime information
     :type context: :class: `NoneType`
+    :param ndjson: Stream sentences to stdout as newline delimited JSON instead of logging them
+    :type ndjson: :class: `bool`
     """
     logger.info(f"Beginning execution for event: {event}")
+    # Sentences may be streamed to stdout, so keep metrics out of the way of them.
+    instrumentation.set_emf_stream(sys.stderr)
 
     try:
-        sentences = lambda_handler(event, context)
-        if sentences.get('statusCode') != HTTP_OK:
-            raise RuntimeError(f"RuntimeError in Lambda execution: {sentences.get('body')}")
+        if ndjson:
+            count = _stream(event, context)
+        else:
+            sentences = lambda_handler(event, context)
+            if sentences.get('statusCode') != HTTP_OK:
+                raise RuntimeError(f"RuntimeError in Lambda execution: {sentences.get('body')}")
     except Exception as exc:
         logger.exception(f"Exception in execution: {exc}")
         exit(GENERAL_ERROR)
     else:
-        logger.info("Here are your bananas!")
-        for sentence in json.loads(sentences.get('body')):
-            logger.info(sentence)
+        if ndjson:
+            logger.info(f"Streamed {count} bananas")
+        else:
+            logger.info("Here are your bananas!")
+            _log_sentences(json.loads(sentences.get('body')))
         logger.info("Successful execution")
 
 
+def _log_sentences(sentences):
+    # A batch comes back keyed by friend's name.
+    if isinstance(sentences, dict):
+        for name, theirs in sentences.items():
+            logger.info(f"Bananas for {name}:")
+            _log_sentences(theirs)
+    else:
+        for sentence in sentences:
+            logger.info(sentence)
+
+
+def _stream(event, context):
+    phrases = json.loads(event.get('body'))
+    if isinstance(phrases, dict):
+        return _stream_batch(event, context)
+
+    # Straight from Banana rather than paging through the handler, so the words are only classified
+    # once and only one sentence is ever held in memory.
+    count = 0
+    instrumentation.reset()
+    try:
+        for sentence in Banana().stream(phrases):
+            sys.stdout.write(f"{json.dumps(sentence)}\n")
+            count += 1
+        sys.stdout.flush()
+    finally:
+        instrumentation.publish()
+    return count
+
+
+def _stream_batch(event, context):
+    # Batches aren't paged so write out the whole lot, one line per friend's sentence.
+    response = lambda_handler(event, context)
+    if response.get('statusCode') != HTTP_OK:
+        raise RuntimeError(f"RuntimeError in Lambda execution: {response.get('body')}")
+
+    count = 0
+    for name, sentences in json.loads(response.get('body')).items():
+        for sentence in sentences:
+            sys.stdout.write(f"{json.dumps({'name': name, 'sentence': sentence})}\n")
+        count += len(sentences)
+    sys.stdout.flush()
+    return count
+
+
 if __name__ == '__main__':
     # TODO: use real event and context
     args = parse_args()
@@ -52,6 +109,6 @@ if __name__ == '__main__':
 
     if args.performance:
         import cProfile
-        cProfile.run('handler(input_event, input_context)')
+        cProfile.run('handler(input_event, input_context, args.ndjson)')
     else:
-        handler(input_event, input_context)
+        handler(input_event, input_context, args.ndjson)
@@ -5,7 +5,7 @@ rm -rf build/*
 virtualenv build/env
 . build/env/bin/activate
 pip install --upgrade pip
-pip install -r webhook-requirements.txt -t build
+pip install -r requirements-webhook.txt -t build
 cp branch_mutator.py build
 mkdir build/cli_tools
 cp ../cli_tools/cli_logger.py build/cli_tools/cli_logger.py
@@ -22,3 +22,9 @@ aws lambda create-function \
     --environment Variables="{AMAZON_ACCOUNT=${AMAZON_ACCOUNT},GITHUB_OWNER=${GITHUB_OWNER},GITHUB_SECRET=${GITHUB_SECRET},GITHUB_TOKEN=${GITHUB_TOKEN}}" \
     --role "arn:aws:iam::${AMAZON_ACCOUNT}:role/lambda-banana-role" \
     --profile ${AWS_PROFILE:=default}
+cd ../..
+aws cloudformation create-stack \
+    --stack-name ${WEBHOOK_STACK:=banana-webhook} \
+    --template-body file://infrastructure/cloudformation-webhook.yml \
+    --capabilities CAPABILITY_IAM \
+    --profile ${AWS_PROFILE}
@@ -0,0 +1,341 @@
+"""
+Benchmark Banana against local stand-ins for DynamoDB and the Oxford Dictionaries API, so no AWS
+account or API quota is needed and the numbers only move when the code does. Each stand-in sleeps
+for a configurable latency per call to simulate the network.
+
+Every iteration is timed stage by stage (tokenise, classify, clean, order, sentences) with the peak
+memory allocated by each, then Banana.execute is timed end to end. The first iterations are thrown
+away as warm up. Unless --keep-cache is passed, every word is looked up from cold each time: the
+in-process caches and the stubbed DynamoDB table are emptied, so each word costs an Oxford call and
+--oxford-latency-ms shows in the numbers. The report has p50/p95/p99 latencies and throughput, and
+can be saved as JSON and compared against one saved from another commit e.g.:
+
+    python -m tests.performance.benchmark --output before.json
+    git checkout my-branch
+    python -m tests.performance.benchmark --output after.json --baseline before.json
+"""
+
+# pylint: disable=invalid-name, logging-fstring-interpolation, protected-access
+# pylint: disable=too-few-public-methods
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import time
+import tracemalloc
+
+from types import SimpleNamespace
+from unittest import mock
+
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+
+from bananas_as_a_service import aws, word_classifier
+from bananas_as_a_service.banana import Banana
+from bananas_as_a_service.data_access_layer import oxford_dao
+from bananas_as_a_service.data_access_layer.oxford_dao import RateLimiter
+from bananas_as_a_service.word_classifier import WordClassifier
+from cli_tools.cli_logger import get_logger
+from cli_tools.yaml_loader import load_yaml_file
+
+logger = get_logger()
+
+DEFAULT_PHRASES = os.path.join(os.path.dirname(__file__), 'benchmark.yml')
+STAGES = ['tokenise', 'classify', 'clean', 'order', 'sentences']
+PERCENTILES = [50, 95, 99]
+_CATEGORIES = ['noun', 'adjective', 'adverb', 'verb', 'preposition']
+
+
+class StubTable:
+    """
+    Just enough of a boto3 DynamoDB resource's client to serve batch reads and writes from a dict.
+    Items are kept as plain values, and sent and received as typed attribute values.
+    """
+
+    _serializer = TypeSerializer()
+    _deserializer = TypeDeserializer()
+
+    def __init__(self, table_name, partition_key, latency):
+        self._table_name = table_name
+        self._partition_key = partition_key
+        self._latency = latency
+        self.items = {}
+        self.calls = 0
+        self.meta = SimpleNamespace(client=self)
+
+    def batch_get_item(self, RequestItems):
+        """Returns the stored items for the requested keys."""
+        self._call()
+        table_name, request = next(iter(RequestItems.items()))
+        keys = [self._deserializer.deserialize(key.get(self._partition_key))
+                for key in request.get('Keys')]
+        return {
+            'Responses': {table_name: [
+                {name: self._serializer.serialize(value) for name, value in self.items[key].items()}
+                for key in keys if key in self.items
+            ]},
+            'UnprocessedKeys': {},
+        }
+
+    def batch_write_item(self, RequestItems):
+        """Stores the requested items."""
+        self._call()
+        for requests in RequestItems.values():
+            for request in requests:
+                item = {
+                    name: self._deserializer.deserialize(value)
+                    for name, value in request.get('PutRequest').get('Item').items()
+                }
+                self.items[item.get(self._partition_key)] = item
+        return {'UnprocessedItems': {}}
+
+    def _call(self):
+        self.calls += 1
+        time.sleep(self._latency)
+
+
+class StubResponse:
+    """Looks like a requests.Response from the Oxford inflections endpoint."""
+
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.headers = {}
+        self._body = body
+
+    def json(self):
+        """Returns the parsed body."""
+        return self._body
+
+
+class StubSession:
+    """
+    Stands in for the Oxford API requests.Session. Every word is found, with a lexical category
+    picked deterministically from its length so that runs are repeatable.
+    """
+
+    def __init__(self, latency):
+        self._latency = latency
+        self.calls = 0
+
+    def get(self, url, headers=None):  # pylint: disable=unused-argument
+        """Returns a classification for the word at the end of the URL."""
+        self.calls += 1
+        time.sleep(self._latency)
+        word = url.rsplit('/', 1)[-1]
+        category = _CATEGORIES[len(word) % len(_CATEGORIES)]
+        return StubResponse(200, {'results': [{'lexicalEntries': [{
+            'lexicalCategory': category.capitalize(),
+            'grammaticalFeatures': [],
+            'inflectionOf': [{'id': word, 'text': word}],
+        }]}]})
+
+
+def parse_args():
+    """
+    Defines and parses command line arguments.
+
+    :return: Parsed arguments
+    :rtype: :class: `argparse.Namespace`
+    """
+    parser = argparse.ArgumentParser(description='Benchmark Banana against stubbed services.')
+    parser.add_argument('-b', '--bananas', default=DEFAULT_PHRASES, help='YAML file of phrases')
+    parser.add_argument('-i', '--iterations', type=int, default=20, help='Measured iterations')
+    parser.add_argument('-w', '--warmup', type=int, default=1, help='Iterations to throw away')
+    parser.add_argument(
+        '-d', '--dynamo-latency-ms', type=float, default=10, help='Simulated DynamoDB latency')
+    parser.add_argument(
+        '-x', '--oxford-latency-ms', type=float, default=200, help='Simulated Oxford API latency')
+    parser.add_argument(
+        '-k', '--keep-cache', action='store_true',
+        help="Keep the in-process caches and stubbed DynamoDB table between iterations, warm"
+    )
+    parser.add_argument('-o', '--output', help='Write the results to this JSON file')
+    parser.add_argument('-c', '--baseline', help='Compare against results saved from a prior run')
+    return parser.parse_args()
+
+
+def percentiles(samples):
+    """
+    Summarises samples by percentile, using the nearest rank.
+
+    :param samples: Measurements
+    :type samples: :class: `list`
+    :return: Measurement at each of PERCENTILES, keyed as e.g. 'p50'
+    :rtype: :class: `dict`
+    """
+    ordered = sorted(samples)
+    return {
+        f'p{percentile}': ordered[max(0, -(-len(ordered) * percentile // 100) - 1)]
+        for percentile in PERCENTILES
+    }
+
+
+def _measure(func):
+    # Elapsed milliseconds and peak bytes allocated while running func.
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = func()
+    finally:
+        elapsed = (time.perf_counter() - start) * 1000
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def _run_stages(data):
+    banana = Banana()
+    timings = {}
+    peaks = {}
+
+    def stage(name, func):
+        result, timings[name], peaks[name] = _measure(func)
+        return result
+
+    # Stages are forced into lists so that the work of each lazy one is counted where it happens.
+    words = stage('tokenise', lambda: banana.words(data))
+    classifier, classified = stage('classify', lambda: _classify(words))
+    cleaned = stage('clean', lambda: banana._clean(classified))
+    ordered = stage('order', lambda: list(banana._order(cleaned)))
+    sentences = stage('sentences', lambda: list(banana._make_some_sentences(ordered)))
+    classifier.flush()
+    return timings, peaks, len(sentences)
+
+
+def _classify(words):
+    classifier = WordClassifier(words)
+    return classifier, classifier.classify()
+
+
+def benchmark(data, iterations, warmup, dynamo_latency, oxford_latency, keep_cache):
+    """
+    Runs Banana repeatedly against stubbed services.
+
+    :param data: Phrases
+    :type data: :class: `list`
+    :param iterations: Number of measured iterations
+    :type iterations: :class: `int`
+    :param warmup: Number of iterations run first and not measured
+    :type warmup: :class: `int`
+    :param dynamo_latency: Seconds each DynamoDB call takes
+    :type dynamo_latency: :class: `float`
+    :param oxford_latency: Seconds each Oxford API call takes
+    :type oxford_latency: :class: `float`
+    :param keep_cache: Whether the in-process caches and stubbed table survive between iterations
+    :type keep_cache: :class: `bool`
+    :return: Results
+    :rtype: :class: `dict`
+    """
+    os.environ.setdefault('TABLE_NAME', 'banana-words')
+    os.environ.setdefault('PARTITION_KEY', 'word')
+
+    table = StubTable(os.environ['TABLE_NAME'], os.environ['PARTITION_KEY'], dynamo_latency)
+    session = StubSession(oxford_latency)
+    credentials = (float('inf'), 'benchmark')
+
+    stage_timings = {name: [] for name in STAGES}
+    stage_peaks = {name: [] for name in STAGES}
+    totals = []
+    sentence_count = 0
+    with mock.patch.dict(aws._resources, {'dynamodb': table}), \
+            mock.patch.dict(aws._parameters, {'app_id': credentials, 'app_key': credentials}), \
+            mock.patch.object(oxford_dao, 'session', session), \
+            mock.patch.object(oxford_dao, 'rate_limiter', RateLimiter(0)):
+        for iteration in range(warmup + iterations):
+            if not keep_cache:
+                _clear_caches(table)
+            timings, peaks, sentence_count = _run_stages(data)
+            if not keep_cache:
+                _clear_caches(table)
+            _, total, _ = _measure(lambda: Banana().execute(data))
+
+            if iteration < warmup:
+                continue
+            for name in STAGES:
+                stage_timings[name].append(timings[name])
+                stage_peaks[name].append(peaks[name])
+            totals.append(total)
+
+    return {
+        'commit': _get_commit(),
+        'iterations': iterations,
+        'words': len(list(Banana._tokenise(data))),
+        'sentences': sentence_count,
+        'dynamo_latency_ms': dynamo_latency * 1000,
+        'oxford_latency_ms': oxford_latency * 1000,
+        'keep_cache': keep_cache,
+        'execute_ms': percentiles(totals),
+        'executions_per_second': round(len(totals) / (sum(totals) / 1000), 2),
+        'sentences_per_second': round(sentence_count * len(totals) / (sum(totals) / 1000), 2),
+        'stages': {
+            name: dict(percentiles(stage_timings[name]), peak_bytes=max(stage_peaks[name]))
+            for name in STAGES
+        },
+    }
+
+
+def _clear_caches(table):
+    # Everything the last run looked up, so the next one has to go all the way to Oxford again.
+    table.items.clear()
+    word_classifier.lexical_cache.clear()
+    word_classifier.blacklist_cache.clear()
+
+
+def _get_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _log_results(results, baseline=None):
+    def change(now, before):
+        return f" ({(now - before) / before:+.0%} vs {before:.1f})" if before else ''
+
+    before = (baseline or {}).get('execute_ms', {})
+    logger.info(f"Commit: {results.get('commit')}, {results.get('words')} words, "
+                f"{results.get('sentences')} sentences, {results.get('iterations')} iterations")
+    for key, value in results.get('execute_ms').items():
+        logger.info(f"execute {key}: {value:.1f}ms{change(value, before.get(key))}")
+    logger.info(f"Throughput: {results.get('executions_per_second')} executions/s, "
+                f"{results.get('sentences_per_second')} sentences/s")
+
+    for name, stats in results.get('stages').items():
+        before = (baseline or {}).get('stages', {}).get(name, {})
+        logger.info(
+            f"{name:>10}: " +
+            ', '.join(f"{key} {stats[key]:.1f}ms{change(stats[key], before.get(key))}"
+                      for key in (f'p{percentile}' for percentile in PERCENTILES)) +
+            f", peak {stats.get('peak_bytes') / 1024:.1f}KiB"
+        )
+
+
+def main():
+    """Command line entry point."""
+    args = parse_args()
+    # The application logs every word it touches; keep it quiet so the report can be read.
+    logging.getLogger('bananas_as_a_service.app_logger').setLevel(logging.WARNING)
+
+    results = benchmark(
+        load_yaml_file(args.bananas), args.iterations, args.warmup,
+        args.dynamo_latency_ms / 1000, args.oxford_latency_ms / 1000, args.keep_cache,
+    )
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    _log_results(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+        logger.info(f"Results written to: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Tests for what the Lambda handler records, run against the benchmark's stand-ins for DynamoDB and
+the Oxford API so that no AWS account or API quota is needed.
+"""
+
+# pylint: disable=missing-docstring, protected-access
+
+import io
+import json
+import os
+import unittest
+
+from unittest import mock
+
+from bananas_as_a_service import app, aws, instrumentation, word_classifier
+from bananas_as_a_service.data_access_layer import oxford_dao
+from bananas_as_a_service.data_access_layer.oxford_dao import RateLimiter
+from bananas_as_a_service.lexicon_snapshot import LexiconSnapshot
+from tests.performance.benchmark import StubSession, StubTable
+
+PHRASES = ['Cool bananas', 'Five minutes']
+CREDENTIALS = (float('inf'), 'test')
+
+
+class Context:
+    function_name = 'banana'
+
+
+@mock.patch.dict(os.environ, {'TABLE_NAME': 'banana-words', 'PARTITION_KEY': 'word'})
+class TestLambdaHandlerInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        self.table = StubTable('banana-words', 'word', 0)
+        self.session = StubSession(0)
+        self.sink = instrumentation.InMemorySink()
+        instrumentation.add_sink(self.sink)
+        self.addCleanup(instrumentation.remove_sink, self.sink)
+
+        word_classifier.lexical_cache.clear()
+        word_classifier.blacklist_cache.clear()
+        self.addCleanup(word_classifier.lexical_cache.clear)
+        self.addCleanup(word_classifier.blacklist_cache.clear)
+        for patcher in (
+                mock.patch.dict(aws._resources, {'dynamodb': self.table}),
+                mock.patch.dict(aws._parameters, {'app_id': CREDENTIALS, 'app_key': CREDENTIALS}),
+                mock.patch.object(oxford_dao, 'session', self.session),
+                mock.patch.object(oxford_dao, 'rate_limiter', RateLimiter(0)),
+                mock.patch.object(word_classifier, 'lexicon_snapshot', LexiconSnapshot()),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _invoke(self, context=None):
+        response = app.lambda_handler({'body': json.dumps(PHRASES)}, context)
+        self.assertEqual(response.get('statusCode'), app.HTTP_OK)
+        return json.loads(response.get('body')), self.sink.records[-1]
+
+    def test_cold_invocation_spans_and_counts(self):
+        sentences, record = self._invoke(Context())
+
+        counts = record.get('counts')
+        self.assertEqual(counts.get('banana.words'), 4)
+        self.assertEqual(counts.get('banana.sentences'), len(sentences))
+        # 'five' is classified as a number without a request.
+        self.assertEqual(counts.get('oxford.found'), 4)
+        self.assertEqual(self.session.calls, 3)
+        self.assertEqual(counts.get('dynamodb.written'), len(self.table.items))
+        self.assertEqual(counts.get('http.200'), 1)
+
+        spans = record.get('spans')
+        for name in ('banana.tokenise', 'banana.classify', 'banana.clean', 'banana.generate',
+                     'banana.flush', 'lambda_handler'):
+            self.assertEqual(len(spans.get(name)), 1, name)
+        self.assertEqual(len(spans.get('oxford.request')), self.session.calls)
+        self.assertEqual(record.get('dimensions'), {'FunctionName': 'banana'})
+
+    def test_warm_invocation_only_counts_its_own_calls(self):
+        self._invoke()
+        calls = self.session.calls
+
+        _, record = self._invoke()
+
+        self.assertEqual(self.session.calls, calls)
+        self.assertEqual(record.get('counts').get('lexical_cache.hits'), 4)
+        self.assertNotIn('oxford.request', record.get('spans'))
+        self.assertEqual(len(record.get('spans').get('lambda_handler')), 1)
+
+    def test_emf_has_a_metric_for_every_span_and_count(self):
+        stream = io.StringIO()
+        sink = instrumentation.EmfSink('Bananas', stream)
+        instrumentation.add_sink(sink)
+        self.addCleanup(instrumentation.remove_sink, sink)
+
+        _, record = self._invoke()
+
+        document = json.loads(stream.getvalue())
+        metrics = document['_aws']['CloudWatchMetrics'][0]['Metrics']
+        names = [metric.get('Name') for metric in metrics]
+        self.assertEqual(len(names), len(set(names)))
+        self.assertEqual(len(names), 2 * len(record.get('spans')) + len(record.get('counts')))
+
+    def test_set_emf_stream_moves_emf_off_stdout(self):
+        stream = io.StringIO()
+        sink = instrumentation.EmfSink('Bananas')
+        instrumentation.add_sink(sink)
+        self.addCleanup(instrumentation.remove_sink, sink)
+
+        with mock.patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            instrumentation.set_emf_stream(stream)
+            self._invoke()
+
+        self.assertEqual(stdout.getvalue(), '')
+        self.assertIn('_aws', json.loads(stream.getvalue()))
+
+    def test_batch_of_a_bare_string_is_a_bad_request(self):
+        for phrases in ('Cool bananas', ['Cool bananas', 5], None):
+            response = app.lambda_handler({'body': json.dumps({'al': phrases})}, None)
+
+            self.assertEqual(response.get('statusCode'), app.HTTP_BAD_REQUEST, phrases)
+            self.assertIn("['al']", json.loads(response.get('body')))
+        self.assertEqual(self.session.calls, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,384 @@
+"""
+Tests for fetching the pipeline template from the GitHub contents API, against a local stand-in
+served with http.server that answers conditional requests the way GitHub does, and for stack
+operations and batches of queued webhooks against a stand-in for CloudFormation.
+"""
+
+# pylint: disable=missing-docstring, protected-access, invalid-name
+
+import hashlib
+import json
+import os
+import threading
+import time
+import unittest
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from queue import Queue
+from socketserver import ThreadingMixIn
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+from botocore.exceptions import ClientError
+
+from webhooks import branch_mutator
+
+SECRETS = {'github_owner': 'owner', 'github_token': 'token', 'amazon_account': '123456789012'}
+TEMPLATE = 'Resources:\n  Bucket:\n    Type: AWS::S3::Bucket\n'
+CHANGED_TEMPLATE = 'Resources:\n  Topic:\n    Type: AWS::SNS::Topic\n'
+
+
+class StubGitHub(BaseHTTPRequestHandler):
+    """Serves the template for each branch, with an ETag of its content."""
+
+    protocol_version = 'HTTP/1.1'
+    templates = {}
+    requests = []
+
+    def do_GET(self):
+        branch = parse_qs(urlparse(self.path).query).get('ref', [None])[0]
+        self.requests.append({
+            'path': urlparse(self.path).path,
+            'branch': branch,
+            'If-None-Match': self.headers.get('If-None-Match'),
+            'Authorization': self.headers.get('Authorization'),
+        })
+        template = self.templates.get(branch)
+        if template is None:
+            self._respond(404)
+            return
+
+        etag = f'"{hashlib.sha1(template.encode("utf-8")).hexdigest()}"'
+        if self.headers.get('If-None-Match') == etag:
+            self._respond(304, etag=etag)
+        else:
+            self._respond(200, template.encode('utf-8'), etag)
+
+    def _respond(self, status, body=b'', etag=None):
+        self.send_response(status)
+        if etag:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    """One thread per connection, as the connection pool keeps them alive between requests."""
+
+    daemon_threads = True
+
+
+class TestFetchTemplate(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = StubServer(('127.0.0.1', 0), StubGitHub)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        branch_mutator._http.clear()  # Close the kept alive connections to the stand-in
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        StubGitHub.templates = {'feature': TEMPLATE, 'other': TEMPLATE}
+        StubGitHub.requests = []
+        for patcher in (
+                mock.patch.dict(os.environ, {
+                    'GITHUB_API_URL': f'http://127.0.0.1:{self.server.server_port}'}),
+                mock.patch.object(branch_mutator, '_templates', branch_mutator.OrderedDict()),
+                mock.patch.object(branch_mutator, '_etags', branch_mutator.OrderedDict()),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        to_json = mock.patch.object(branch_mutator, 'to_json', wraps=branch_mutator.to_json)
+        self.to_json = to_json.start()
+        self.addCleanup(to_json.stop)
+
+    def test_fetches_and_remembers_etag(self):
+        template = branch_mutator._fetch_template('feature', SECRETS)
+
+        self.assertEqual(template, {'Resources': {'Bucket': {'Type': 'AWS::S3::Bucket'}}})
+        request = StubGitHub.requests[-1]
+        self.assertEqual(request['path'], (
+            f'/repos/owner/bananas-as-a-service/contents/{branch_mutator.TEMPLATE_PATH}'))
+        self.assertEqual(request['branch'], 'feature')
+        self.assertEqual(request['Authorization'], 'token token')
+        self.assertIsNone(request['If-None-Match'])
+        self.assertIn(branch_mutator._etags['feature'], branch_mutator._templates)
+
+    def test_unchanged_template_is_not_modified(self):
+        first = branch_mutator._fetch_template('feature', SECRETS)
+        second = branch_mutator._fetch_template('feature', SECRETS)
+
+        self.assertIs(second, first)
+        self.assertEqual(StubGitHub.requests[-1]['If-None-Match'], branch_mutator._etags['feature'])
+        self.assertEqual(self.to_json.call_count, 1)
+
+    def test_branches_sharing_a_template_convert_it_once(self):
+        feature = branch_mutator._fetch_template('feature', SECRETS)
+        other = branch_mutator._fetch_template('other', SECRETS)
+
+        # The other branch has never been seen so can't ask if it changed, but its ETag matches.
+        self.assertIsNone(StubGitHub.requests[-1]['If-None-Match'])
+        self.assertIs(other, feature)
+        self.assertEqual(branch_mutator._etags['other'], branch_mutator._etags['feature'])
+        self.assertEqual(self.to_json.call_count, 1)
+
+    def test_changed_template_is_converted_again(self):
+        branch_mutator._fetch_template('feature', SECRETS)
+        StubGitHub.templates['feature'] = CHANGED_TEMPLATE
+
+        template = branch_mutator._fetch_template('feature', SECRETS)
+
+        self.assertEqual(template, {'Resources': {'Topic': {'Type': 'AWS::SNS::Topic'}}})
+        self.assertEqual(self.to_json.call_count, 2)
+
+    def test_missing_template_is_a_client_error(self):
+        with self.assertRaises(RuntimeError):
+            branch_mutator._fetch_template('missing', SECRETS)
+
+    @mock.patch.object(branch_mutator, 'ETAG_CACHE_SIZE', 2)
+    def test_etags_are_bounded(self):
+        StubGitHub.templates['third'] = TEMPLATE
+        for branch in ('feature', 'other', 'third'):
+            branch_mutator._fetch_template(branch, SECRETS)
+
+        self.assertEqual(list(branch_mutator._etags), ['other', 'third'])
+
+
+class StubCloudFormation:
+    """Records CloudFormation calls, failing those for the stacks it is told to."""
+
+    def __init__(self, failing=(), missing=()):
+        self.failing = failing
+        self.missing = missing
+        self.in_flight = 0
+        self.most_in_flight = 0
+        self._lock = threading.Lock()
+
+    def create_stack(self, StackName, **kwargs):  # pylint: disable=unused-argument
+        return self._call('CreateStack', StackName)
+
+    def delete_stack(self, StackName, **kwargs):  # pylint: disable=unused-argument
+        return self._call('DeleteStack', StackName)
+
+    def describe_stacks(self, StackName):
+        if StackName in self.missing:
+            raise _client_error('DescribeStacks', f"Stack with id {StackName} does not exist")
+        return {'Stacks': [{'StackName': StackName, 'StackStatus': 'CREATE_COMPLETE'}]}
+
+    def _call(self, operation, stack_name):
+        with self._lock:
+            self.in_flight += 1
+            self.most_in_flight = max(self.most_in_flight, self.in_flight)
+        time.sleep(0.01)
+        with self._lock:
+            self.in_flight -= 1
+        if stack_name in self.failing:
+            raise _client_error(operation, f"Stack {stack_name} is in a bad state")
+        return {'StackId': f'arn:{stack_name}'}
+
+
+def _client_error(operation, message):
+    return ClientError({'Error': {'Code': 'ValidationError', 'Message': message}}, operation)
+
+
+class TestStackOperations(unittest.TestCase):
+
+    def _use(self, cloudformation, wait_seconds='0'):
+        for patcher in (
+                mock.patch.dict(branch_mutator._clients, {'cloudformation': cloudformation}),
+                mock.patch.dict(os.environ, {'STACK_WAIT_SECONDS': wait_seconds}),
+                mock.patch.object(branch_mutator, 'POLL_DELAY', 0),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_failed_stack_is_reported_alongside_the_rest(self):
+        self._use(StubCloudFormation(failing=['banana-feature-app']))
+
+        results = branch_mutator._delete(['feature'], SECRETS)
+
+        self.assertEqual(results[0]['StackName'], 'banana-feature-app')
+        self.assertIn('bad state', results[0]['Error'])
+        self.assertEqual(results[1], {'StackId': 'arn:banana-feature-pipeline'})
+
+    def test_every_stack_failing_is_a_server_error(self):
+        self._use(StubCloudFormation(failing=['banana-feature-app', 'banana-feature-pipeline']))
+
+        with self.assertRaises(SystemError):
+            branch_mutator._delete(['feature'], SECRETS)
+
+    def test_operations_in_flight_are_bounded(self):
+        cloudformation = StubCloudFormation()
+        self._use(cloudformation)
+
+        results = branch_mutator._delete([f'feature-{number}' for number in range(10)], SECRETS)
+
+        self.assertEqual(len(results), 20)
+        self.assertLessEqual(cloudformation.most_in_flight, branch_mutator.STACK_CONCURRENCY)
+
+    def test_deleted_stack_that_no_longer_exists_is_complete(self):
+        self._use(StubCloudFormation(missing=['banana-feature-app']), wait_seconds='5')
+
+        results = branch_mutator._delete(['feature'], SECRETS)
+
+        self.assertEqual(results[0]['StackStatus'], 'DELETE_COMPLETE')
+
+    def test_created_stack_that_does_not_exist_is_an_error(self):
+        self._use(StubCloudFormation(missing=['banana-feature-pipeline']), wait_seconds='5')
+
+        results = branch_mutator._deploy({'feature': ({'Resources': {}}, [])}, SECRETS)
+
+        self.assertEqual(results[0]['StackName'], 'banana-feature-pipeline')
+        self.assertIn('does not exist', results[0]['Error'])
+
+
+def _webhook(branch, event_type):
+    return {'headers': {'X-GitHub-Event': event_type}, 'body': json.dumps({'ref': branch})}
+
+
+def _batch(*events):
+    # Records as SQS delivers them from the FIFO queue, numbered in the order they were sent.
+    records = []
+    for number, (branch, event_type, sequence) in enumerate(events):
+        record = branch_mutator._record(_webhook(branch, event_type))
+        record['messageId'] = f'{number}'
+        record['attributes'] = {'SequenceNumber': f'{sequence}', 'MessageGroupId': branch}
+        records.append(record)
+    return {'Records': records}
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.cloudformation = StubCloudFormation(
+            failing=['banana-broken-app', 'banana-broken-pipeline'])
+        self.cloudformation.create_stack = mock.Mock(wraps=self.cloudformation.create_stack)
+        self.cloudformation.delete_stack = mock.Mock(wraps=self.cloudformation.delete_stack)
+        for patcher in (
+                mock.patch.dict(branch_mutator._clients, {'cloudformation': self.cloudformation}),
+                mock.patch.dict(branch_mutator._secrets, {
+                    'values': SECRETS, 'expires': float('inf')}),
+                mock.patch.dict(os.environ, {'STACK_WAIT_SECONDS': '0'}),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_failed_branch_reports_its_records_only(self):
+        response = branch_mutator.lambda_handler(_batch(
+            ('broken', branch_mutator.DELETE, 1),
+            ('feature', branch_mutator.DELETE, 2),
+            ('broken', branch_mutator.DELETE, 3),
+        ), None)
+
+        self.assertEqual(response, {'batchItemFailures': [
+            {'itemIdentifier': '0'}, {'itemIdentifier': '2'}]})
+        self.assertEqual(self.cloudformation.delete_stack.call_count, 4)
+
+    def test_unreadable_record_is_reported(self):
+        event = _batch(('feature', branch_mutator.DELETE, 1))
+        event['Records'][0]['body'] = 'not json'
+
+        response = branch_mutator.lambda_handler(event, None)
+
+        self.assertEqual(response, {'batchItemFailures': [{'itemIdentifier': '0'}]})
+        self.cloudformation.delete_stack.assert_not_called()
+
+    def test_records_after_an_unreadable_one_in_its_group_are_reported(self):
+        event = _batch(
+            ('feature', branch_mutator.CREATE, 2),
+            ('feature', branch_mutator.DELETE, 1),
+            ('other', branch_mutator.DELETE, 3),
+            ('feature', branch_mutator.DELETE, 4),
+        )
+        event['Records'][1]['body'] = 'not json'
+
+        response = branch_mutator.lambda_handler(event, None)
+
+        self.assertEqual(response, {'batchItemFailures': [
+            {'itemIdentifier': '1'}, {'itemIdentifier': '0'}, {'itemIdentifier': '3'}]})
+        self.assertEqual(self.cloudformation.delete_stack.call_count, 2)
+        self.cloudformation.create_stack.assert_not_called()
+
+    def test_records_are_coalesced_in_the_order_sent(self):
+        # Sent as create, create again, delete so nothing is left to do, whatever order they're in.
+        response = branch_mutator.lambda_handler(_batch(
+            ('feature', branch_mutator.CREATE, 1),
+            ('feature', branch_mutator.DELETE, 3),
+            ('feature', branch_mutator.CREATE, 2),
+        ), None)
+
+        self.assertEqual(response, {'batchItemFailures': []})
+        self.cloudformation.create_stack.assert_not_called()
+        self.cloudformation.delete_stack.assert_not_called()
+
+    def test_failing_the_whole_batch_is_raised(self):
+        branch_mutator._secrets['values'] = None
+        ssm = mock.Mock()
+        ssm.get_parameters.side_effect = _client_error('GetParameters', "Throttled")
+
+        with mock.patch.dict(branch_mutator._clients, {'ssm': ssm}):
+            with self.assertRaises(SystemError):
+                branch_mutator.lambda_handler(_batch(('feature', branch_mutator.DELETE, 1)), None)
+
+    def test_collect_events_gives_up_on_an_empty_queue(self):
+        event = branch_mutator.collect_events(Queue(), timeout=0.01)
+
+        self.assertEqual(event, {'Records': []})
+        self.assertEqual(branch_mutator.lambda_handler(event, None), {'batchItemFailures': []})
+
+    def test_collect_events_reads_as_the_queue_would_deliver(self):
+        events = Queue()
+        events.put(_webhook('feature', branch_mutator.DELETE))
+
+        records = branch_mutator.collect_events(events, window=0.01, timeout=0.01)['Records']
+
+        self.assertEqual(branch_mutator._parse_headers(branch_mutator._record_event(records[0])), (
+            'feature', branch_mutator.DELETE))
+
+
+class TestSettings(unittest.TestCase):
+
+    def setUp(self):
+        self.ssm = mock.Mock()
+        self.ssm.get_parameters.return_value = {'Parameters': [
+            {'Name': name, 'Value': value} for name, value in SECRETS.items()]}
+        for patcher in (
+                mock.patch.dict(branch_mutator._clients, {'ssm': self.ssm}),
+                mock.patch.dict(branch_mutator._secrets, {'values': None, 'expires': 0}),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @mock.patch.dict(os.environ, {'SECRETS_TTL': '300'})
+    def test_secrets_are_kept_for_the_ttl(self):
+        self.assertEqual(branch_mutator._get_secrets(), SECRETS)
+        self.assertEqual(branch_mutator._get_secrets(), SECRETS)
+        self.assertEqual(self.ssm.get_parameters.call_count, 1)
+
+    @mock.patch.dict(os.environ, {'SECRETS_TTL': '5m'})
+    def test_invalid_ttl_is_a_server_error(self):
+        with self.assertRaises(SystemError):
+            branch_mutator._get_secrets()
+        self.ssm.get_parameters.assert_not_called()
+
+    @mock.patch.dict(os.environ, {'STACK_WAIT_SECONDS': 'abc'})
+    def test_invalid_stack_wait_is_a_server_error(self):
+        cloudformation = StubCloudFormation()
+        cloudformation.delete_stack = mock.Mock()
+
+        with mock.patch.dict(branch_mutator._clients, {'cloudformation': cloudformation}):
+            with self.assertRaises(SystemError):
+                branch_mutator._delete(['feature'], SECRETS)
+        cloudformation.delete_stack.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+"""
+Tests for the grammar that orders words into sentences, checked against the cartesian product that
+Banana used to build every sentence from before sentences were generated lazily.
+"""
+
+# pylint: disable=missing-docstring
+
+import os
+import random
+import unittest
+
+from itertools import product
+from unittest import mock
+
+from ordered_set import OrderedSet
+
+from bananas_as_a_service.classification import Classification
+from bananas_as_a_service.error_handler import GeneralError
+from bananas_as_a_service.grammar import Grammar
+
+ORDERING = ['number', 'adverb', 'adjective', 'noun']
+VOCABULARY = ['a', 'b', 'c', 'd', 'e', 'f', 1, 2, 3]
+
+
+def cartesian_order(classified):
+    # How Banana used to order words: every combination, repeated words dropped, then the same
+    # again without a number at the start.
+    mapped = {}
+    for word, categories in classified:
+        for kind in ORDERING:
+            if kind in categories:
+                mapped.setdefault(kind, []).append(word)
+    slots = [mapped.get(kind) for kind in ORDERING if mapped.get(kind)]
+    duplicates_removed = OrderedSet(tuple(OrderedSet(sentence)) for sentence in product(*slots))
+    no_need_for_numbers = OrderedSet(
+        sentence[1:] for sentence in duplicates_removed
+        if len(sentence) > 1 and isinstance(sentence[0], int)
+    )
+    return set(duplicates_removed.union(no_need_for_numbers)) - {()}
+
+
+def template_products(grammar_templates, classified):
+    # Every sentence each template could make, any word in a slot again simply left out.
+    sentences = set()
+    for template in grammar_templates:
+        slots = [[word for word, categories in classified if name in categories]
+                 for name in template]
+        for sentence in product(*(slot for slot in slots if slot)):
+            sentences.add(tuple(OrderedSet(sentence)))
+    return sentences - {()}
+
+
+def random_classified(rng, vocabulary, names):
+    classified = []
+    for word in rng.sample(vocabulary, rng.randint(1, len(vocabulary) - 2)):
+        if isinstance(word, int):
+            classified.append((word, ['number']))
+        else:
+            classified.append((word, rng.sample(names, rng.randint(1, 3))))
+    return classified
+
+
+class TestGrammar(unittest.TestCase):
+
+    def _sentences(self, grammar, classified, after=None):
+        index = self._index(grammar, classified)
+        return list(grammar.sentences(index, after))
+
+    @classmethod
+    def _index(cls, grammar, classified):
+        return grammar.index([
+            Classification.from_dict(word, {'categories': categories}).restricted_to(
+                grammar.categories)
+            for word, categories in classified
+        ])
+
+    def test_same_sentences_as_cartesian_product(self):
+        rng = random.Random(1)
+        grammar = Grammar()
+        for _ in range(3000):
+            classified = random_classified(rng, VOCABULARY, ['adverb', 'adjective', 'noun', 'verb'])
+            sentences = self._sentences(grammar, classified)
+
+            self.assertEqual(len(sentences), len(set(sentences)), classified)
+            self.assertEqual(set(sentences), cartesian_order(classified), classified)
+
+    def test_repeated_slots(self):
+        grammar = Grammar([['adjective', 'adjective', 'noun']])
+        classified = [('cool', ['adjective']), ('easy', ['adjective', 'noun']), ('beans', ['noun'])]
+
+        # The second slot can't repeat the first word so is left empty, once, where it sorts.
+        self.assertEqual(self._sentences(grammar, classified), [
+            ('cool', 'beans'),
+            ('cool', 'easy', 'beans'),
+            ('cool', 'easy'),
+            ('easy', 'cool', 'beans'),
+            ('easy', 'cool'),
+            ('easy', 'beans'),
+            ('easy',),
+        ])
+
+    def test_repeated_slots_match_template_products(self):
+        rng = random.Random(2)
+        names = ['adverb', 'adjective', 'noun']
+        templates = [['adverb', 'adjective', 'noun'], ['adjective', 'adjective', 'noun']]
+        grammar = Grammar(templates)
+        for _ in range(1000):
+            classified = random_classified(rng, ['a', 'b', 'c', 'd', 'e', 'f', 'g'], names)
+            sentences = self._sentences(grammar, classified)
+
+            self.assertEqual(len(sentences), len(set(sentences)), classified)
+            self.assertEqual(set(sentences), template_products(templates, classified), classified)
+
+    def test_carries_on_after_every_position(self):
+        rng = random.Random(3)
+        grammar = Grammar([['adjective', 'adjective', 'noun'], ['adverb', 'adjective', 'noun']])
+        for _ in range(100):
+            classified = random_classified(rng, VOCABULARY, ['adverb', 'adjective', 'noun'])
+            index = self._index(grammar, classified)
+            sentences = list(grammar.sentences(index))
+
+            positions = [grammar.position(index, sentence) for sentence in sentences]
+            self.assertEqual(positions, sorted(set(positions)))
+            for number, position in enumerate(positions):
+                self.assertEqual(list(grammar.sentences(index, position)), sentences[number + 1:])
+
+    def test_position_not_of_these_words(self):
+        grammar = Grammar()
+        index = self._index(grammar, [('cool', ['adjective']), ('beans', ['noun'])])
+
+        for position in [(5, (0, 0)), (0, (0,)), (0, (2, 0)), (-1, (0, 0))]:
+            with self.assertRaises(ValueError):
+                grammar.sentences(index, position)
+
+    @mock.patch.dict(os.environ, {'GRAMMAR_TEMPLATES': 'Adjective noun; ;adverb noun;'})
+    def test_from_environment_skips_blank_templates(self):
+        grammar = Grammar.from_environment()
+        classified = [('cool', ['adjective']), ('quickly', ['adverb']), ('beans', ['noun'])]
+
+        self.assertEqual(set(self._sentences(grammar, classified)), {
+            ('cool', 'beans'), ('quickly', 'beans')})
+
+    @mock.patch.dict(os.environ, {'GRAMMAR_TEMPLATES': 'adjective noun;banana'})
+    def test_from_environment_unknown_category(self):
+        with self.assertRaises(GeneralError):
+            Grammar.from_environment()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,183 @@
+"""
+Tests for the memory mapped lexicon file format: the header, the sorted index and its binary search,
+the string table and writing the file in full before it replaces another.
+"""
+
+# pylint: disable=missing-docstring, protected-access
+
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from decimal import Decimal
+
+from bananas_as_a_service import lexicon_file
+from bananas_as_a_service.error_handler import GeneralError
+from bananas_as_a_service.lexicon_file import LexiconBuilder, LexiconFile, replace_when_written
+
+BANANAS = {'categories': ['noun'], 'features': ['plural'], 'inflection': ['banana']}
+
+
+class TestLexiconFile(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'lexicon.lex')
+
+    def _build(self, entries):
+        builder = LexiconBuilder()
+        for word, value in entries.items():
+            builder.add(word, value)
+        self.assertEqual(builder.write(self.path), len(entries))
+        lexicon = LexiconFile(self.path)
+        self.addCleanup(lexicon.close)
+        return lexicon
+
+    def _header(self, **fields):
+        with open(self.path, 'rb') as lexicon:
+            values = list(lexicon_file._HEADER.unpack(lexicon.read(lexicon_file._HEADER.size)))
+        names = ['magic', 'version', 'flags', 'count', 'strings', 'index', 'string_table',
+                 'records']
+        for name, value in fields.items():
+            values[names.index(name)] = value
+        with open(self.path, 'r+b') as lexicon:
+            lexicon.write(lexicon_file._HEADER.pack(*values))
+
+    def test_round_trip(self):
+        value = {
+            'categories': ['noun', 'verb'],
+            'nested': {'count': 3, 'score': 0.5, 'stored': Decimal('2'), 'empty': []},
+            'flags': [True, False, None],
+            'negative': -7,
+        }
+        lexicon = self._build({'bananas': BANANAS, 'cool': value})
+
+        self.assertEqual(len(lexicon), 2)
+        self.assertEqual(lexicon.get('bananas'), BANANAS)
+        self.assertEqual(lexicon.get('cool'), {
+            'categories': ['noun', 'verb'],
+            'nested': {'count': 3, 'score': 0.5, 'stored': 2, 'empty': []},
+            'flags': [True, False, None],
+            'negative': -7,
+        })
+        self.assertIn('cool', lexicon)
+        self.assertIsNone(lexicon.get('beans'))
+        self.assertEqual(lexicon.get('beans', {}), {})
+
+    def test_empty_lexicon(self):
+        lexicon = self._build({})
+
+        self.assertEqual(len(lexicon), 0)
+        self.assertIsNone(lexicon.get('bananas'))
+
+    def test_int_key_is_stored_as_a_string(self):
+        lexicon = self._build({5: {'categories': ['number']}})
+
+        self.assertEqual(lexicon.get('5'), {'categories': ['number']})
+        self.assertIsNone(lexicon.get(5))
+
+    def test_non_ascii_keys(self):
+        words = ['café', 'cafe', 'caff', 'naïve', 'über', 'zebra', '香蕉']
+        lexicon = self._build({word: {'categories': [word]} for word in words})
+
+        for word in words:
+            self.assertEqual(lexicon.get(word), {'categories': [word]}, word)
+
+    def test_index_is_sorted_and_searched_for_every_word(self):
+        words = [f'{letter}{number}' for letter in 'zyxba' for number in range(40)] + ['a', 'aa']
+        lexicon = self._build({word: {'categories': ['noun']} for word in words})
+
+        keys = []
+        for number in range(len(lexicon)):
+            string_id, _ = lexicon_file._INDEX_ENTRY.unpack_from(
+                lexicon._map, lexicon._index_offset + number * lexicon_file._INDEX_ENTRY.size)
+            keys.append(lexicon._string_bytes(string_id))
+        self.assertEqual(keys, sorted(word.encode('utf-8') for word in words))
+        for word in words:
+            self.assertIn(word, lexicon)
+        for word in ['', 'a00', 'b40', 'c1', 'zz', '~']:
+            self.assertNotIn(word, lexicon)
+
+    def test_strings_are_stored_once(self):
+        self._build({f'word{number}': BANANAS for number in range(50)})
+
+        with open(self.path, 'rb') as lexicon:
+            header = lexicon_file._HEADER.unpack(lexicon.read(lexicon_file._HEADER.size))
+        # 50 keys, then 3 names and 3 values shared by every record
+        self.assertEqual(header[4], 50 + 6)
+
+    def test_rejects_bad_magic(self):
+        self._build({'bananas': BANANAS})
+        self._header(magic=b'JUNK')
+
+        self.assertFalse(LexiconFile.is_lexicon_file(self.path))
+        with self.assertRaises(GeneralError):
+            LexiconFile(self.path)
+
+    def test_rejects_other_version(self):
+        self._build({'bananas': BANANAS})
+        self._header(version=lexicon_file.VERSION + 1)
+
+        self.assertTrue(LexiconFile.is_lexicon_file(self.path))
+        with self.assertRaises(GeneralError):
+            LexiconFile(self.path)
+
+    def test_rejects_truncated_file(self):
+        self._build({'bananas': BANANAS, 'cool': BANANAS})
+        with open(self.path, 'r+b') as lexicon:
+            lexicon.truncate(lexicon_file._HEADER.size + 4)
+
+        with self.assertRaises(GeneralError):
+            LexiconFile(self.path)
+
+    def test_rejects_empty_file(self):
+        open(self.path, 'wb').close()
+
+        self.assertFalse(LexiconFile.is_lexicon_file(self.path))
+        with self.assertRaises(GeneralError):
+            LexiconFile(self.path)
+
+    def test_rejects_unstorable_value(self):
+        builder = LexiconBuilder()
+        builder.add('bananas', {'categories': {'noun'}})
+
+        with self.assertRaises(GeneralError):
+            builder.write(self.path)
+        self.assertFalse(os.path.exists(self.path))
+
+
+class TestReplaceWhenWritten(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'lexicon.lex')
+        with open(self.path, 'wb') as existing:
+            existing.write(b'old')
+
+    def test_replaces_once_written(self):
+        with replace_when_written(self.path) as new:
+            new.write(b'new')
+            with open(self.path, 'rb') as existing:
+                self.assertEqual(existing.read(), b'old')
+
+        with open(self.path, 'rb') as replaced:
+            self.assertEqual(replaced.read(), b'new')
+        self.assertEqual(os.listdir(self.directory), ['lexicon.lex'])
+
+    def test_failed_write_leaves_the_old_file(self):
+        with self.assertRaises(struct.error):
+            with replace_when_written(self.path) as new:
+                new.write(b'half')
+                struct.pack('<H', -1)
+
+        with open(self.path, 'rb') as existing:
+            self.assertEqual(existing.read(), b'old')
+        self.assertEqual(os.listdir(self.directory), ['lexicon.lex'])
+
+
+if __name__ == '__main__':
+    unittest.main()
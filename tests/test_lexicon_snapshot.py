@@ -0,0 +1,63 @@
+"""
+Tests for loading the lexicon snapshot at cold start, which must never stop the function loading.
+"""
+
+# pylint: disable=missing-docstring
+
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from unittest import mock
+
+from bananas_as_a_service.classification import Classification
+from bananas_as_a_service.lexicon_snapshot import LexiconSnapshot
+
+BANANAS = Classification.from_dict('bananas', {'categories': ['noun']})
+
+
+class TestFromEnvironment(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def _from_environment(self, path):
+        with mock.patch.dict(os.environ, {'LEXICON_SNAPSHOT': path}):
+            return LexiconSnapshot.from_environment()
+
+    def test_loads_snapshot(self):
+        for name in ('lexicon.json.gz', 'lexicon.lex'):
+            path = os.path.join(self.directory, name)
+            LexiconSnapshot.write(path, [BANANAS])
+
+            snapshot = self._from_environment(path)
+
+            self.assertEqual(snapshot.get_many(['bananas', 'beans']), {'bananas': BANANAS}, name)
+
+    def test_missing_snapshot_is_empty(self):
+        snapshot = self._from_environment(os.path.join(self.directory, 'lexicon.json.gz'))
+
+        self.assertEqual(len(snapshot), 0)
+
+    def test_corrupt_snapshot_is_empty(self):
+        truncated = os.path.join(self.directory, 'truncated.json.gz')
+        with gzip.open(truncated, 'wt', encoding='utf-8') as snapshot_file:
+            snapshot_file.write('{"bananas": {"categ')
+        not_gzipped = os.path.join(self.directory, 'not_gzipped.json.gz')
+        with open(not_gzipped, 'w') as snapshot_file:
+            snapshot_file.write('{}')
+        old_version = os.path.join(self.directory, 'old_version.lex')
+        with open(old_version, 'wb') as lexicon_file:
+            lexicon_file.write(b'BLEX' + bytes(28))
+
+        for path in (truncated, not_gzipped, old_version, self.directory):
+            snapshot = self._from_environment(path)
+
+            self.assertEqual(snapshot.get_many(['bananas']), {}, path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+"""
+Tests for the Redis protocol cache tier, against fakeredis rather than a real server.
+"""
+
+# pylint: disable=missing-docstring, protected-access
+
+import json
+import os
+import unittest
+
+from unittest import mock
+
+import fakeredis
+
+from bananas_as_a_service import instrumentation
+from bananas_as_a_service.classification import Category, Classification
+from bananas_as_a_service.data_access_layer.redis_dao import RedisDAO
+
+
+class BrokenRedis:
+    """Client whose every call fails, as when the cache is unreachable."""
+
+    def mget(self, keys):
+        raise ConnectionError("Connection refused")
+
+    def pipeline(self, transaction=True):
+        raise ConnectionError("Connection refused")
+
+
+class TestRedisDAO(unittest.TestCase):
+
+    def setUp(self):
+        self.client = fakeredis.FakeStrictRedis()
+        self.dao = RedisDAO(self.client)
+        self.bananas = Classification('bananas', Category.NOUN, features=('plural',))
+
+    def test_check_cache_returns_cached_words_only(self):
+        self.client.set(RedisDAO._key('bananas'), json.dumps(self.bananas.to_dict()))
+
+        found = self.dao.check_cache(['bananas', 'beans'])
+
+        self.assertEqual(found, {'bananas': self.bananas})
+
+    def test_check_cache_with_no_words_makes_no_call(self):
+        self.assertEqual(RedisDAO(BrokenRedis()).check_cache([]), {})
+
+    def test_update_cache_round_trips_with_expiry(self):
+        five = Classification(5, Category.NUMBER)
+
+        self.dao.update_cache([self.bananas, five])
+
+        self.assertEqual(self.dao.check_cache(['bananas', 5]), {'bananas': self.bananas, 5: five})
+        self.assertGreater(self.client.ttl(RedisDAO._key('bananas')), 0)
+
+    def test_check_cache_falls_back_when_client_raises(self):
+        instrumentation.reset()
+
+        self.assertEqual(RedisDAO(BrokenRedis()).check_cache(['bananas']), {})
+        self.assertEqual(instrumentation.recorder.snapshot()['counts']['redis.errors'], 1)
+
+    def test_update_cache_carries_on_when_client_raises(self):
+        instrumentation.reset()
+
+        RedisDAO(BrokenRedis()).update_cache([self.bananas])
+        self.assertEqual(instrumentation.recorder.snapshot()['counts']['redis.errors'], 1)
+
+    @mock.patch.dict(os.environ, clear=True)
+    def test_disabled_without_client(self):
+        dao = RedisDAO()
+
+        self.assertFalse(dao.enabled)
+        self.assertEqual(dao.check_cache(['bananas']), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,44 +7,120 @@ then destroy it when the branch is deleted.
 It was attempted to do all of this in CodePipeline. Essentially a CodePipeline which creates
 CodePipelines. However every new feature branch pipeline was considered a replacement for the
 existing one managed by CloudFormation in the deploy stage.
+
+Only the pipeline template is needed from the source so the archive is streamed into a spooled
+temporary file, which stays in memory unless the archive is big, and only that is extracted.
+
+Set SOURCE_MODE=contents to instead fetch just the template from the GitHub contents API, through a
+connection pool kept for warm invocations. Templates are cached by their ETag, so a repeat webhook
+for an unchanged template is answered with a 304 Not Modified and skips converting it again, as does
+a new branch whose template is the same as one already seen. Point GITHUB_API_URL at a local stub to
+test it.
+
+Stack operations are issued concurrently, e.g. deleting a branch's app and pipeline stacks at the
+same time. By default the response is CloudFormation's, returned as soon as the operations have
+started. Set STACK_WAIT_SECONDS to instead poll the stacks, backing off between polls, until they
+finish or that many seconds have passed. The response is then each stack's final status and how
+long it took e.g.:
+
+    [{"StackName": "banana-x-app", "StackStatus": "DELETE_COMPLETE", "Seconds": 41.2}]
+
+with "TimedOut": true for any still in progress. Keep it within the Lambda and API Gateway timeouts.
+A stack whose operation fails is reported as e.g. {"StackName": "banana-x-app", "Error": "..."}
+while the others carry on, and only if every one fails is the response an error.
+
+Events can also arrive in batches, as the records of an SQS event whose bodies are each the payload
+of one webhook, with its X-GitHub-Event header as a message attribute of the same name.
+infrastructure/cloudformation-webhook.yml has API Gateway put them on a FIFO queue with the branch
+as the message group, so each branch's events are delivered in the order GitHub sent them, and
+delays them a few seconds so that those close together arrive in the same batch. A create and delete
+of the same branch in a batch cancel out, as do repeats, so a branch that was created and deleted
+again in quick succession is never deployed at all. The rest are deployed or deleted together, with
+the secrets, connection and converted templates shared between them. The response is then the
+records that failed, and those after them in the same message group, for SQS to retry, as
+{"batchItemFailures": [{"itemIdentifier": ...}]} and anything that fails the whole batch is raised
+so that all of it is retried. For a local stand-in put API Gateway events on a `queue.Queue` and
+pass the result of `collect_events` to the handler.
+
+Secrets are read from Parameter Store in a single call and kept for SECRETS_TTL seconds, five
+minutes by default, and boto3 clients are made once, so a warm invocation usually makes no calls to
+either before getting on with CloudFormation. Set SECRETS_TTL=0 to read them every time.
 """
 import json
 import os
-
+import time
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty
+from uuid import uuid4
+from shutil import copyfileobj
+from tempfile import SpooledTemporaryFile
 from urllib import request
 from urllib.error import URLError
 from zipfile import ZipFile, BadZipFile
 
+import urllib3
+
 from boto3 import client
 from botocore.exceptions import ClientError
 from cfn_flip import to_json
+from urllib3.exceptions import HTTPError
 
 from cli_tools.cli_logger import get_logger
 
 logger = get_logger()
 
 HTTP_OK = 200
+HTTP_NOT_MODIFIED = 304
 HTTP_CLIENT_ERR = 400
 HTTP_SERVER_ERR = 500
 REGION_NAME = 'ap-southeast-2'
+TEMPLATE_PATH = 'infrastructure/cloudformation-pipeline.yml'
+SOURCE_FILES = [TEMPLATE_PATH]  # Relative to the root of the repository
+SPOOL_MAX_SIZE = 32 * 1024 * 1024  # Bytes of archive held in memory before spilling to /tmp
+DOWNLOAD_TIMEOUT = 20  # Seconds
+ARCHIVE_MODE = 'archive'
+CONTENTS_MODE = 'contents'
+DEFAULT_GITHUB_API_URL = 'https://api.github.com'
+TEMPLATE_CACHE_SIZE = 32
+ETAG_CACHE_SIZE = 256  # Branches
+POLL_DELAY = 2  # Seconds before the first poll of stack status
+POLL_MAX_DELAY = 15  # Seconds
+POLL_BACKOFF = 2  # Multiplier of the delay after each poll
+COALESCE_WINDOW = 5  # Seconds
+COLLECT_TIMEOUT = 20  # Seconds to wait for a first event, as long as SQS long polls for
+CREATE = 'create'
+SECRETS = ['github_secret', 'github_token', 'github_owner', 'amazon_account']
+DEFAULT_SECRETS_TTL = 300  # Seconds
+DELETE = 'delete'
+STACK_CONCURRENCY = 4  # CloudFormation calls in flight at once, within its API rate limit
+
+# Module level so that warm invocations re-use connections and converted templates.
+_http = urllib3.PoolManager(maxsize=2, timeout=DOWNLOAD_TIMEOUT)
+_templates = OrderedDict()  # Converted templates keyed by ETag, least recently used first
+_etags = OrderedDict()  # ETag last seen for each branch, least recently used first
+_clients = {}  # boto3 clients keyed by service name
+_secrets = {'values': None, 'expires': 0}
 
 
 def lambda_handler(event, context):
     logger.info(f"Starting Lambda execution with context: {context}")
 
+    if 'Records' in event:
+        # SQS only reads which records failed, and retries the whole batch if this raises.
+        return _handle_batch(event['Records'])
+
     # Instead of creating custom exceptions, use RuntimeError for Client and SystemError for Server.
     response_body = None
     try:
         branch, event_type = _parse_headers(event)
         secrets = _get_secrets()
 
-        if event_type == 'create':
-            _scrub()
-            _source(branch, secrets)
-            template, params = _build(branch, secrets)
-            response_body = _deploy(branch, template, params, secrets)
-        elif event_type == 'delete':
-            response_body = _delete(branch, secrets)
+        if event_type == CREATE:
+            response_body = _create([branch], secrets)
+        elif event_type == DELETE:
+            response_body = _delete([branch], secrets)
     except RuntimeError as err:
         logger.error(f"RuntimeError: {err}")
         return _create_response(HTTP_CLIENT_ERR, err)
@@ -55,6 +131,136 @@ def lambda_handler(event, context):
         return _create_response(HTTP_OK, response_body)
 
 
+def collect_events(event_queue, window=COALESCE_WINDOW, timeout=COLLECT_TIMEOUT):
+    """
+    Collects webhook events from a queue for a window, as an SQS event with batching would.
+
+    :param event_queue: Queue of API Gateway events
+    :type event_queue: :class: `queue.Queue`
+    :param window: Seconds to collect events for after the first one arrives
+    :type window: :class: `float`
+    :param timeout: Seconds to wait for the first event, before giving up with no records
+    :type timeout: :class: `float`
+    :return: Event of every one collected, to pass to `lambda_handler`
+    :rtype: :class: `dict`
+    """
+    try:
+        records = [_record(event_queue.get(timeout=timeout))]
+    except Empty:
+        return {'Records': []}
+    deadline = time.monotonic() + window
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            records.append(_record(event_queue.get(timeout=remaining)))
+        except Empty:
+            break
+    return {'Records': records}
+
+
+def _record(event):
+    return {
+        'messageId': str(uuid4()),
+        'body': event.get('body'),
+        'messageAttributes': {
+            name: {'stringValue': value, 'dataType': 'String'}
+            for name, value in (event.get('headers') or {}).items()
+        },
+    }
+
+
+def _record_event(record):
+    # The API Gateway event the webhook would have been, were it not queued.
+    return {
+        'headers': {
+            name: attribute['stringValue']
+            for name, attribute in (record.get('messageAttributes') or {}).items()
+        },
+        'body': record['body'],
+    }
+
+
+def _handle_batch(records):
+    logger.info(f"Handling batch of {len(records)} event(s)")
+
+    failures = []
+    failed_groups = set()
+    events = []
+    for record in sorted(records, key=_sent_order):
+        group = (record.get('attributes') or {}).get('MessageGroupId')
+        if group is not None and group in failed_groups:
+            # Handling it ahead of one that failed would lose their order when that is retried.
+            failures.append(record.get('messageId'))
+            continue
+        try:
+            branch, event_type = _parse_headers(_record_event(record))
+        except (KeyError, ValueError, RuntimeError) as err:
+            # Retrying won't help, but SQS then moves it to the dead letter queue to be looked at.
+            logger.error(f"{err} with record: {record}")
+            failures.append(record.get('messageId'))
+            failed_groups.add(group)
+        else:
+            events.append((record.get('messageId'), branch, event_type))
+
+    survivors = _coalesce([(branch, event_type) for _, branch, event_type in events])
+    creates = [branch for branch, event_type in survivors.items() if event_type == CREATE]
+    deletes = [branch for branch, event_type in survivors.items() if event_type == DELETE]
+    cancelled = [branch for branch in dict.fromkeys(
+        branch for _, branch, _ in events) if branch not in survivors]
+    logger.info(f"Coalesced to create: {creates} delete: {deletes} cancelled: {cancelled}")
+
+    failed = set()
+    if creates or deletes:
+        secrets = _get_secrets()
+        for branches, operation in ((creates, _create), (deletes, _delete)):
+            if not branches:
+                continue
+            try:
+                results = operation(branches, secrets)
+            except (RuntimeError, SystemError) as err:
+                logger.error(f"{err} with branches: {branches}")
+                failed.update(branches)
+            else:
+                logger.info(f"Results: {results}")
+                failed.update(_failed_branches(branches, results))
+
+    failures.extend(message_id for message_id, branch, _ in events if branch in failed)
+    return {'batchItemFailures': [{'itemIdentifier': message_id} for message_id in failures]}
+
+
+def _sent_order(record):
+    # A FIFO queue numbers messages in the order they were sent, otherwise go by when they were.
+    attributes = record.get('attributes') or {}
+    return int(attributes.get('SequenceNumber') or attributes.get('SentTimestamp') or 0)
+
+
+def _failed_branches(branches, results):
+    # Stacks are named after their branch, so a stack that failed fails its branch's events.
+    failed = {
+        result.get('StackName') for result in results
+        if 'Error' in result or str(result.get('StackStatus')).endswith('_FAILED')
+    }
+    return [
+        branch for branch in branches
+        if failed & {f'banana-{branch}-app', f'banana-{branch}-pipeline'}
+    ]
+
+
+def _coalesce(events):
+    # Opposite events for a branch cancel out and repeats are dropped, leaving at most one each.
+    survivors = {}
+    for branch, event_type in events:
+        if event_type not in (CREATE, DELETE):
+            continue
+        if branch not in survivors:
+            survivors[branch] = event_type
+        elif survivors[branch] != event_type:
+            del survivors[branch]
+    return survivors
+
+
 def _create_response(response_code, response_body):
     # Can't JSON serialise an exception by default so let's be lazy and just stringify it.
     return {
@@ -92,18 +298,32 @@ def _scrub():
 def _get_secrets():
     logger.info("Getting secrets")
 
-    params = ['github_secret', 'github_token', 'github_owner', 'amazon_account']
-    ssm_parameters = {}
+    if _secrets['values'] is not None and time.monotonic() < _secrets['expires']:
+        return _secrets['values']
+
     try:
-        for param in params:
-            this_param = client(
-                'ssm', region_name=REGION_NAME).get_parameter(Name=param, WithDecryption=True)
-            ssm_parameters.update({
-                this_param.get('Parameter').get('Name'): this_param.get('Parameter').get('Value')})
+        ttl = float(os.environ.get('SECRETS_TTL', DEFAULT_SECRETS_TTL))
+    except ValueError as err:
+        raise SystemError(f"Invalid SECRETS_TTL environment variable: {err}")
+
+    try:
+        response = _get_client('ssm').get_parameters(Names=SECRETS, WithDecryption=True)
     except ClientError as err:
         raise SystemError(f"{err} getting parameters from Parameter Store")
-    else:
-        return ssm_parameters
+    if response.get('InvalidParameters'):
+        raise SystemError(
+            f"Parameters: {response.get('InvalidParameters')} not found in Parameter Store")
+
+    _secrets['values'] = {param.get('Name'): param.get('Value') for param in response['Parameters']}
+    _secrets['expires'] = time.monotonic() + ttl
+    return _secrets['values']
+
+
+def _get_client(service_name):
+    # Clients are thread safe, so one of each is shared by everything in the container.
+    if service_name not in _clients:
+        _clients[service_name] = client(service_name, region_name=REGION_NAME)
+    return _clients[service_name]
 
 
 def _source(branch, secrets):
@@ -114,26 +334,44 @@ def _source(branch, secrets):
         f"bananas-as-a-service/archive/{branch}.zip"
     )
     logger.info("Download from GitHub started")
-    try:
-        filename, _ = request.urlretrieve(url, filename="/tmp/banana.zip")
-    except URLError as err:
-        raise RuntimeError(f"{err} in URL: {url}")
-    else:
-        logger.info("Download from GitHub complete")
-
-    try:
-        with ZipFile(filename, 'r') as zip_ref:
-            zip_ref.extractall('/tmp')
-    except BadZipFile as err:
-        raise SystemError(f"{err} opening zip file: {filename}")
-    else:
-        logger.info(f"Zip file: {filename} opened")
+    with SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as archive:
+        try:
+            with request.urlopen(url, timeout=DOWNLOAD_TIMEOUT) as response:
+                copyfileobj(response, archive)
+        except URLError as err:
+            raise RuntimeError(f"{err} in URL: {url}")
+        else:
+            logger.info(f"Download from GitHub complete: {archive.tell()} bytes")
+
+        try:
+            with ZipFile(archive, 'r') as zip_ref:
+                # Members are all under a top level directory named after the repository and branch.
+                members = [
+                    member for member in zip_ref.namelist()
+                    if member.partition('/')[2] in SOURCE_FILES
+                ]
+                for member in members:
+                    zip_ref.extract(member, '/tmp')
+        except BadZipFile as err:
+            raise SystemError(f"{err} opening zip file from: {url}")
+        else:
+            logger.info(f"Extracted from zip file: {members}")
+
+
+def _get_source_mode():
+    mode = os.environ.get('SOURCE_MODE', ARCHIVE_MODE)
+    if mode not in (ARCHIVE_MODE, CONTENTS_MODE):
+        raise SystemError(f"Unknown SOURCE_MODE: {mode}")
+    return mode
 
 
 def _build(branch, secrets):
     logger.info("Building")
 
-    template = _load_template(branch)
+    if _get_source_mode() == CONTENTS_MODE:
+        template = _fetch_template(branch, secrets)
+    else:
+        template = _load_template(branch)
     params = _create_parameters(branch, secrets)
     return template, params
 
@@ -141,17 +379,67 @@ def _build(branch, secrets):
 def _load_template(branch):
     logger.info("Loading template")
 
-    directory = f'/tmp/bananas-as-a-service-{branch}/infrastructure'
-    template = f'{directory}/cloudformation-pipeline.yml'
+    template = f'/tmp/bananas-as-a-service-{branch}/{TEMPLATE_PATH}'
     try:
         with open(template) as yaml_file:
-            data = json.loads(to_json(yaml_file))
-            if not data:
-                raise RuntimeError(f"YAML file: {template} is empty")
+            return _convert_template(yaml_file.read(), template)
     except (IOError, FileNotFoundError) as err:
         raise SystemError(f"{err}")
+
+
+def _fetch_template(branch, secrets):
+    logger.info("Fetching template")
+
+    url = (
+        f"{os.environ.get('GITHUB_API_URL', DEFAULT_GITHUB_API_URL)}/repos/"
+        f"{secrets.get('github_owner')}/bananas-as-a-service/contents/{TEMPLATE_PATH}"
+    )
+    headers = {
+        'Accept': 'application/vnd.github.v3.raw',
+        'Authorization': f"token {secrets.get('github_token')}",
+        'User-Agent': 'banana-branch-mutator',
+    }
+    etag = _etags.get(branch)
+    if etag in _templates:
+        headers['If-None-Match'] = etag
+
+    try:
+        response = _http.request('GET', url, fields={'ref': branch}, headers=headers)
+    except HTTPError as err:
+        raise RuntimeError(f"{err} in URL: {url}")
+
+    if response.status == HTTP_NOT_MODIFIED and etag in _templates:
+        logger.info(f"Template not modified since ETag: {etag}")
+        _templates.move_to_end(etag)
+        return _templates[etag]
+    if response.status != HTTP_OK:
+        raise RuntimeError(f"HTTP status code: {response.status} in URL: {url}")
+
+    etag = response.headers.get('ETag')
+    if etag in _templates:
+        # Another branch had exactly the same template.
+        logger.info(f"Template already converted for ETag: {etag}")
+        _templates.move_to_end(etag)
+        data = _templates[etag]
     else:
-        return data
+        data = _convert_template(response.data.decode('utf-8'), url)
+        if etag:
+            _templates[etag] = data
+            while len(_templates) > TEMPLATE_CACHE_SIZE:
+                _templates.popitem(last=False)
+    if etag:
+        _etags[branch] = etag
+        _etags.move_to_end(branch)
+        while len(_etags) > ETAG_CACHE_SIZE:
+            _etags.popitem(last=False)
+    return data
+
+
+def _convert_template(yaml_text, source):
+    data = json.loads(to_json(yaml_text))
+    if not data:
+        raise RuntimeError(f"YAML file: {source} is empty")
+    return data
 
 
 def _create_parameters(branch, secrets):
@@ -199,43 +487,143 @@ def _create_parameters(branch, secrets):
     return [{'ParameterKey': keys[i], 'ParameterValue': values[i]} for i, _ in enumerate(keys)]
 
 
-def _deploy(branch, template, params, secrets):
+def _create(branches, secrets):
+    if _get_source_mode() == ARCHIVE_MODE:
+        _scrub()
+        for branch in branches:
+            _source(branch, secrets)
+    return _deploy({branch: _build(branch, secrets) for branch in branches}, secrets)
+
+
+def _deploy(builds, secrets):
     logger.info("Deploying")
 
-    cloudformation_client = client('cloudformation', region_name=REGION_NAME)
     amazon_account = secrets.get('amazon_account')
+    operations = {}
+    templates = {}
+    for branch, (template, params) in builds.items():
+        # Branches usually share a template, which is then only serialised once.
+        if id(template) not in templates:
+            templates[id(template)] = json.dumps(template)
+        operations[f'banana-{branch}-pipeline'] = ('create_stack', {
+            'TemplateBody': templates[id(template)],
+            'Parameters': params,
+            'Capabilities': ['CAPABILITY_NAMED_IAM'],
+            'RoleARN': f'arn:aws:iam::{amazon_account}:role/cloudformation-banana-role',
+        })
+    return _run_stack_operations(operations)
+
+
+def _delete(branches, secrets):
+    logger.info("Deleting")
+
+    amazon_account = secrets.get('amazon_account')
+    role = {'RoleARN': f'arn:aws:iam::{amazon_account}:role/cloudformation-banana-role'}
+
+    # The app and pipeline stacks don't depend on each other so can be deleted at the same time.
+    operations = {}
+    for branch in branches:
+        operations[f'banana-{branch}-app'] = ('delete_stack', role)
+        operations[f'banana-{branch}-pipeline'] = ('delete_stack', role)
+        _etags.pop(branch, None)  # A deleted branch's template won't be fetched again
+    return _run_stack_operations(operations)
 
+
+def _run_stack_operations(operations):
+    # Runs CloudFormation operations keyed by stack name concurrently, then waits for them if asked.
+    # A stack whose operation fails is reported with its error rather than failing the others.
+    try:
+        wait_seconds = float(os.environ.get('STACK_WAIT_SECONDS', 0))
+    except ValueError as err:
+        raise SystemError(f"Invalid STACK_WAIT_SECONDS environment variable: {err}")
+
+    cloudformation_client = _get_client('cloudformation')
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=min(STACK_CONCURRENCY, len(operations))) as executor:
+        futures = {
+            stack_name: executor.submit(
+                getattr(cloudformation_client, method), StackName=stack_name, **kwargs)
+            for stack_name, (method, kwargs) in operations.items()
+        }
+    results = {}
+    for stack_name, future in futures.items():
+        try:
+            results[stack_name] = future.result()
+        except ClientError as err:
+            results[stack_name] = _failed(stack_name, err)
+    if all('Error' in result for result in results.values()):
+        raise SystemError(f"Every CloudFormation operation failed: {list(results.values())}")
+
+    if wait_seconds > 0:
+        waiting = {
+            stack_name: method for stack_name, (method, _) in operations.items()
+            if 'Error' not in results[stack_name]
+        }
+        results.update(_wait_for_stacks(cloudformation_client, waiting, started, wait_seconds))
+    return [results[stack_name] for stack_name in operations]
+
+
+def _wait_for_stacks(cloudformation_client, methods, started, wait_seconds):
+    logger.info(f"Waiting up to {wait_seconds} seconds for stacks: {list(methods)}")
+
+    deadline = started + wait_seconds
+    delay = POLL_DELAY
+    statuses = {stack_name: None for stack_name in methods}
+    summary = {}
+    with ThreadPoolExecutor(max_workers=min(STACK_CONCURRENCY, len(methods))) as executor:
+        while statuses:
+            time.sleep(max(0, min(delay, deadline - time.monotonic())))
+            delay = min(delay * POLL_BACKOFF, POLL_MAX_DELAY)
+
+            futures = {
+                stack_name: executor.submit(
+                    _get_stack_status, cloudformation_client, stack_name, methods[stack_name])
+                for stack_name in statuses
+            }
+            for stack_name, future in futures.items():
+                try:
+                    status = future.result()
+                except ClientError as err:
+                    summary[stack_name] = _failed(stack_name, err)
+                    del statuses[stack_name]
+                    continue
+                statuses[stack_name] = status
+                if not status.endswith('_IN_PROGRESS'):
+                    summary[stack_name] = _summarise(stack_name, status, started)
+                    del statuses[stack_name]
+
+            if statuses and time.monotonic() >= deadline:
+                for stack_name, status in statuses.items():
+                    summary[stack_name] = _summarise(stack_name, status, started, timed_out=True)
+                break
+
+    logger.info(f"Stack statuses: {summary}")
+    return summary
+
+
+def _get_stack_status(cloudformation_client, stack_name, method):
     try:
-        response = cloudformation_client.create_stack(
-            StackName=f'banana-{branch}-pipeline',
-            TemplateBody=json.dumps(template),
-            Parameters=params,
-            Capabilities=['CAPABILITY_NAMED_IAM'],
-            RoleARN=f'arn:aws:iam::{amazon_account}1:role/cloudformation-banana-role',
-        )
+        stacks = cloudformation_client.describe_stacks(StackName=stack_name)['Stacks']
     except ClientError as err:
-        raise SystemError(f"{err} deploying with CloudFormation")
-    else:
-        return response
+        # A stack that has finished deleting can no longer be described by name, but one that was
+        # being created or updated should be there.
+        if method == 'delete_stack' and 'does not exist' in str(err):
+            return 'DELETE_COMPLETE'
+        raise
+    return stacks[0]['StackStatus']
 
 
-def _delete(branch, secrets):
-    logger.info("Deleting")
+def _failed(stack_name, err):
+    logger.error(f"{err} with stack: {stack_name}")
+    return {'StackName': stack_name, 'Error': str(err)}
 
-    cloudformation_client = client('cloudformation', region_name=REGION_NAME)
-    amazon_account = secrets.get('amazon_account')
 
-    resources_to_delete = [f'banana-{branch}-app', f'banana-{branch}-pipeline']
-    responses = []
-    try:
-        for resource in resources_to_delete:
-            responses.append(
-                cloudformation_client.delete_stack(
-                    StackName=resource,
-                    RoleARN=f'arn:aws:iam::{amazon_account}:role/cloudformation-banana-role',
-                )
-            )
-    except ClientError as err:
-        raise SystemError(f"{err} deleting with CloudFormation")
-    else:
-        return responses
+def _summarise(stack_name, status, started, timed_out=False):
+    summary = {
+        'StackName': stack_name,
+        'StackStatus': status,
+        'Seconds': round(time.monotonic() - started, 1),
+    }
+    if timed_out:
+        summary['TimedOut'] = True
+    return summary